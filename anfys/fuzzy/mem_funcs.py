@@ -1,14 +1,15 @@
-import math
-from abc import ABC, abstractmethod
 import numpy as np
-import anfys.lse as lse
+from scipy.special import expit
+from abc import ABC, abstractmethod
 
 
 class MembershipFunction(ABC):
     """ This class represents an interface for Membership Functions. Any
     function class must have both methods to calculate the membership
     degree of a given value, and to calculate the derivative at a point
-    with respect to a variable.
+    with respect to a variable. Both methods must accept numpy arrays as
+    well as scalars, so a whole batch can be evaluated in a single call
+    through membership_degrees and partials.
     """
 
     def __init__(self):
@@ -22,6 +23,99 @@ class MembershipFunction(ABC):
     def partial(self, value, var, a, b, c=None):
         pass
 
+    def log_membership_degree(self, value, a, b, c=None):
+        """ The natural logarithm of the membership degree. Functions that
+        can compute it without evaluating the degree itself should override
+        this method, so tiny degrees do not underflow to zero.
+        """
+        return np.log(self.membership_degree(value, a, b, c))
+
+    def log_partial(self, value, var, a, b, c=None):
+        """ The derivative of the log of the membership degree with respect
+        to a variable. Functions that can compute it without dividing by the
+        degree should override this method, so it does not vanish when the
+        degree underflows to zero.
+        """
+        degree = self.membership_degree(value, a, b, c)
+        partial = self.partial(value, var, a, b, c)
+        shape = np.broadcast_shapes(np.shape(partial), np.shape(degree))
+        return np.divide(partial, degree, where=degree > 0,
+                         out=np.zeros(shape))
+
+    def kernel(self, params, log_domain=False):
+        """ Check the (... x params) parameters once and return the function
+        computing the membership degrees, or their logs, of values against
+        them, called as kernel(values, a, b, c). Functions that validate
+        their parameters should override this method, so the returned
+        kernel does not check them again on every call.
+        """
+        if log_domain:
+            return self.log_membership_degree
+        return self.membership_degree
+
+    def membership_degrees(self, values, params):
+        """ Compute the membership degree of every value with respect to
+        every membership function at once.
+
+        Parameters
+        ----------
+        values : numpy.arr of double
+            The values to be evaluated, usually a (samples x features) matrix.
+        params : numpy.arr of double
+            The parameters of each membership function, usually a
+            (features x mfs x params) tensor.
+
+        Returns
+        -------
+        mem_degrees : numpy.arr of double
+            A (samples x features x mfs) tensor with the membership degrees.
+        """
+        values, columns = _broadcastable(values, params)
+        return self.membership_degree(values, *columns)
+
+    def log_membership_degrees(self, values, params):
+        """ Same as membership_degrees, but in the log domain """
+        values, columns = _broadcastable(values, params)
+        return self.log_membership_degree(values, *columns)
+
+    def partials(self, values, params):
+        """ Compute the derivative of every membership function at every value
+        with respect to each one of its parameters.
+
+        Parameters
+        ----------
+        values : numpy.arr of double
+            The derivative arguments, usually a (samples x features) matrix.
+        params : numpy.arr of double
+            The parameters of each membership function, usually a
+            (features x mfs x params) tensor.
+
+        Returns
+        -------
+        derivs : numpy.arr of double
+            A (samples x features x mfs x params) tensor with the derivatives,
+            the last axis following the order in self.parameters.
+        """
+        return self._stacked(self.partial, values, params)
+
+    def log_partials(self, values, params):
+        """ Same as partials, but of the log of the membership degrees """
+        return self._stacked(self.log_partial, values, params)
+
+    def _stacked(self, partial, values, params):
+        values, columns = _broadcastable(values, params)
+        shape = np.broadcast_shapes(values.shape, columns[0].shape)
+        derivs = [np.broadcast_to(partial(values, var, *columns), shape)
+                  for var in self.parameters]
+        return np.stack(derivs, axis=-1)
+
+
+def _broadcastable(values, params):
+    values = np.asarray(values, dtype=float)[..., np.newaxis]
+    params = np.asarray(params, dtype=float)
+    columns = [params[..., col] for col in range(params.shape[-1])]
+    return values, columns
+
 
 class BellThree(MembershipFunction):
     """ This class represents a Bell Shaped function with three parameters """
@@ -31,10 +125,16 @@ class BellThree(MembershipFunction):
 
     def membership_degree(self, value, a, b, c=None):
         validate_parameters(a, b, c)
+        return _bell_three(value, a, b, c)
 
-        tmp1 = (value-c) / a
-        denom = 1.0 + (tmp1**2.0)**b
-        return 1.0 / denom
+    def log_membership_degree(self, value, a, b, c=None):
+        validate_parameters(a, b, c)
+        return _log_bell_three(value, a, b, c)
+
+    def kernel(self, params, log_domain=False):
+        params = np.asarray(params, dtype=float)
+        validate_parameters(*(params[..., col] for col in range(3)))
+        return _log_bell_three if log_domain else _bell_three
 
     def partial(self, value, var, a, b, c=None):
         validate_parameters(a, b, c)
@@ -46,12 +146,46 @@ class BellThree(MembershipFunction):
         if var == 'a':
             result = 2.0*b*tmp2 / (a*denom)
         elif var == 'b':
-            result = (-tmp2 * math.log(tmp1**2)) / denom
+            # The partial vanishes at the center, where log(tmp1**2) does not
+            squares = tmp1**2
+            logs = np.log(np.where(squares > 0, squares, 1.0))
+            result = (-tmp2 * logs) / denom
         elif var == 'c':
-            result = 2.0*b * (value-c) * tmp1**(2.0*b - 2.0)
+            result = 2.0*b * (value-c) * (tmp1**2)**(b - 1.0)
             result /= denom * a**2.0
         return result
 
+    def log_partial(self, value, var, a, b, c=None):
+        validate_parameters(a, b, c)
+
+        # The log degree is -log(1 + t), with t = ((value-c)/a)**(2b), so its
+        # partials hold t/(1+t), the expit of log(t)
+        diff = value - c
+        distances = np.abs(diff / a)
+        nonzero = distances > 0
+        log_squares = 2.0 * np.log(np.where(nonzero, distances, 1.0))
+        ratio = np.where(nonzero, expit(b * log_squares), 0.0)
+        if var == 'a':
+            return 2.0*b * ratio / a
+        if var == 'b':
+            return -ratio * log_squares
+        if var == 'c':
+            shape = np.broadcast_shapes(np.shape(ratio), np.shape(diff))
+            return np.divide(2.0*b * ratio, diff, where=nonzero,
+                             out=np.zeros(shape))
+        raise ValueError('BellThree has no parameter \'{}\''.format(var))
+
+
+def _bell_three(value, a, b, c):
+    tmp1 = (value-c) / a
+    denom = 1.0 + (tmp1**2.0)**b
+    return 1.0 / denom
+
+
+def _log_bell_three(value, a, b, c):
+    tmp1 = (value-c) / a
+    return -np.log1p((tmp1**2.0)**b)
+
 
 def validate_parameters(a, b, c):
     check_none_parameter(a, b, c)
@@ -59,7 +193,7 @@ def validate_parameters(a, b, c):
 
 
 def check_zero_division(a):
-    if a == 0:
+    if np.any(np.equal(a, 0)):
         raise ValueError('Zero passed to bellthree as first parameter result\
             in zero division')
 
@@ -77,22 +211,32 @@ class BellTwo(MembershipFunction):
 
     def membership_degree(self, value, a, b, c=None):
         arg = - ((value-b) / a)**2
-        return math.exp(arg)
+        return np.exp(arg)
+
+    def log_membership_degree(self, value, a, b, c=None):
+        return - ((value-b) / a)**2
 
     def partial(self, value, var, a, b, c=None):
         result = 0
         denom = 1.0
         k = ((value-b) / a)**2
         if var == 'a':
-            result = 2*(value-b)**2 * math.exp(-k)
+            result = 2*(value-b)**2 * np.exp(-k)
             denom = a ** 3
         elif var == 'b':
-            result = 2*(value-b) * math.exp(-k)
+            result = 2*(value-b) * np.exp(-k)
             denom = a ** 2
         else:
             raise ValueError('BellTwo has no parameter \'{}\''.format(var))
         return result / denom
 
+    def log_partial(self, value, var, a, b, c=None):
+        if var == 'a':
+            return 2*(value-b)**2 / a**3
+        if var == 'b':
+            return 2*(value-b) / a**2
+        raise ValueError('BellTwo has no parameter \'{}\''.format(var))
+
 
 class PiecewiseLogit(MembershipFunction):
     """ A piecewise linear approximation of logit (inverse of sigmoid) function
@@ -103,14 +247,7 @@ class PiecewiseLogit(MembershipFunction):
         self.parameters = ['p', 'q']
 
     def membership_degree(self, value, p, q, c=None):
-        mem_degree = 0
-        if value <= 0:
-            mem_degree = p
-        elif value > 0 and value < 1:
-            mem_degree = (q-p)*value + p
-        elif value >= 1:
-            mem_degree = q
-        return mem_degree
+        return (q-p)*np.clip(value, 0, 1) + p
 
     def partial(self, value, var, p, q, c=None):
         if var in self.parameters:
@@ -122,15 +259,10 @@ class PiecewiseLogit(MembershipFunction):
             raise ValueError('piecewise logit invalid parameter ', var)
 
     def _partial_p(self, value):
-        if value >= 1:
-            return 0
-        elif value < 1 and value > 0:
-            return 1.0 - value
-        else:
-            return 1
+        return 1.0 - np.clip(value, 0, 1)
 
     def _partial_q(self, value):
-        return lse.clip(value, 1, 0)
+        return np.clip(value, 0, 1)
 
     def coefs(self, value, weight):
         return np.array([self.slope, self.indep, 0.0])
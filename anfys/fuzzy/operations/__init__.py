@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def reduce(operation, values, axis=-1):
+    """ Apply an array tnorm or tconorm across an axis of values, like
+    folding the operation over every slice along it.
+
+    Parameters
+    ----------
+    operation : callable
+        One of the array operations, as in tnorm.ARRAY_TNORMS or
+        tconorm.ARRAY_TCONORMS.
+    values : numpy.arr of double
+        The operands.
+    axis : int
+        The axis to be reduced. Defaults to the last one.
+
+    Returns
+    -------
+    result : numpy.arr of double
+        The values with the given axis reduced.
+    """
+    if isinstance(operation, np.ufunc):
+        return operation.reduce(values, axis=axis)
+    values = np.moveaxis(np.asarray(values), axis, 0)
+    result = values[0]
+    for operand in values[1:]:
+        result = operation(result, operand)
+    return result
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def check_none_tconorm(a, b, funcname):
     if a is None or b is None:
         raise ValueError('None value passed to tconorm.' + funcname)
@@ -39,3 +42,39 @@ def nilpotent_max(a, b):
 def einstein_sum(a, b):
     check_none_tconorm(a, b, 'einstein_sum')
     return (a + b) / (1.0 + a * b)
+
+
+# Array versions of the tconorms above, computed elementwise over numpy
+# arrays. They skip the None checks so they can be used inside the layers.
+
+fmax_array = np.maximum
+
+
+def probabilistic_sum_array(a, b):
+    return a + b - a * b
+
+
+def bounded_sum_array(a, b):
+    return np.minimum(a + b, 1.0)
+
+
+def drastic_array(a, b):
+    return np.where(a == 0, b, np.where(b == 0, a, 1.0))
+
+
+def nilpotent_max_array(a, b):
+    return np.where(a + b < 1.0, np.maximum(a, b), 1.0)
+
+
+def einstein_sum_array(a, b):
+    return (a + b) / (1.0 + a * b)
+
+
+ARRAY_TCONORMS = {
+    'fmax': fmax_array,
+    'probabilistic_sum': probabilistic_sum_array,
+    'bounded_sum': bounded_sum_array,
+    'drastic': drastic_array,
+    'nilpotent_max': nilpotent_max_array,
+    'einstein_sum': einstein_sum_array
+}
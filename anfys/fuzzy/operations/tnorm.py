@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def check_tnorm_none(a, b, funcname):
     if a is None or b is None:
         raise ValueError('None value passed to tnorm.' + funcname)
@@ -49,3 +52,38 @@ def hamacher(a, b):
         prod = a * b
         result = prod / (a + b - prod)
     return result
+
+
+# Array versions of the tnorms above, computed elementwise over numpy arrays.
+# They skip the None checks so they can be used inside the layers.
+
+fmin_array = np.minimum
+prod_array = np.multiply
+
+
+def lukasiewicz_array(a, b):
+    return np.maximum(a + b - 1, 0.0)
+
+
+def drastic_array(a, b):
+    return np.where(a == 1, b, np.where(b == 1, a, 0.0))
+
+
+def nilpotent_array(a, b):
+    return np.where(a + b > 1, np.minimum(a, b), 0.0)
+
+
+def hamacher_array(a, b):
+    prod = a * b
+    denom = np.asarray(a + b - prod, dtype=float)
+    return np.divide(prod, denom, out=np.zeros_like(denom), where=denom != 0)
+
+
+ARRAY_TNORMS = {
+    'fmin': fmin_array,
+    'prod': prod_array,
+    'lukasiewicz': lukasiewicz_array,
+    'drastic': drastic_array,
+    'nilpotent': nilpotent_array,
+    'hamacher': hamacher_array
+}
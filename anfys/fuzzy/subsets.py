@@ -21,10 +21,7 @@ class FuzzySet:
             An array with the membership degree of the given value with respect
             to each membership function in this set.
         """
-        mem_degrees = []
-        for line in params:
-            mem_degrees.append(self.mem_func.membership_degree(value, *line))
-        return mem_degrees
+        return self.mem_func.membership_degrees(value, params)
 
     def partials(self, value, params):
         """ Compute the derivative of each membership function in this set at
@@ -46,10 +43,4 @@ class FuzzySet:
             An array with the value of the derivative at the given value for
             each membership function in this set.
         """
-        all_derivs = []
-        for line in params:
-            derivs = []
-            for variable in self.mem_func.parameters:
-                derivs.append(self.mem_func.partial(value, variable, *line))
-            all_derivs.append(derivs[:])
-        return all_derivs
+        return self.mem_func.partials(value, params)
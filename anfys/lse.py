@@ -1,14 +1,131 @@
 import numpy as np
-from numpy.linalg import inv as minverse
+from numpy.linalg import LinAlgError
+from scipy.linalg import cho_solve, cholesky, qr, solve_triangular
+from scipy.sparse import issparse
 from abc import ABC, abstractmethod
 
 
 class _LSE(ABC):
     """ Interface for Least Square Estimation methods """
+    # Whether refine reads the LinearSystem, so equations must be added to it
+    uses_system = True
+
     @abstractmethod
     def solve(self, coeficients, results):
         ...
 
+    def reset(self):
+        """ Forget any state kept from previous systems """
+        pass
+
+    def solve_system(self, linsys):
+        """ Approximate the parameters of an accumulated LinearSystem """
+        return self.solve(linsys.coeficients(), linsys.results())
+
+    def refine(self, linsys, coeficients, results):
+        """ Approximate the parameters of linsys right after the given
+        equations were added to it. Estimators able to update a previous
+        solution should not solve the whole system again.
+        """
+        return self.solve_system(linsys)
+
+
+class LinearSystem:
+    """ A growable AX = B system. The equations are kept in preallocated
+    buffers that double their capacity when full, and both AᵀA and AᵀB are
+    accumulated as equations arrive, so normal equations are always at hand.
+    Nothing is allocated until the first equation is added. Without
+    keep_equations only the normal equations are kept, so memory does not
+    grow with the amount of equations.
+    """
+
+    def __init__(self, qtd_variables, capacity=64, keep_equations=True):
+        self.qtd_variables = qtd_variables
+        self.keep_equations = keep_equations
+        self.size = 0
+        self.gram = None
+        self.moments = None
+        self._capacity = capacity
+        self._coeficients = None
+        self._results = None
+
+    def add(self, coeficients, results):
+        """ Append one equation, or a block of equations, to the system. The
+        coeficients may be a scipy.sparse matrix.
+        """
+        if issparse(coeficients):
+            coeficients = coeficients.tocsr()
+        else:
+            coeficients = np.atleast_2d(coeficients)
+        results = np.atleast_1d(results)
+        qtd_equations = coeficients.shape[0]
+        if self.gram is None:
+            self._allocate()
+        until = self.size + qtd_equations
+        if self.keep_equations:
+            self._reserve(until)
+            self._coeficients[self.size:until] = _dense(coeficients)
+            self._results[self.size:until] = results
+        self.gram += _dense(coeficients.T @ coeficients)
+        self.moments += coeficients.T @ results
+        self.size = until
+
+    def add_normal_equations(self, gram, moments, qtd_equations):
+        """ Merge the normal equations of qtd_equations equations that were
+        accumulated elsewhere, e.g. on another process. The equations
+        themselves are not available, so the system must not keep them.
+        """
+        if self.keep_equations:
+            raise ValueError('Normal equations can not be merged into a '
+                             'system that keeps its equations')
+        if self.gram is None:
+            self._allocate()
+        self.gram += gram
+        self.moments += moments
+        self.size += qtd_equations
+
+    def coeficients(self):
+        self._check_equations_kept()
+        return self._coeficients[:self.size]
+
+    def results(self):
+        self._check_equations_kept()
+        return self._results[:self.size]
+
+    def _check_equations_kept(self):
+        if not self.keep_equations:
+            raise ValueError('The equations of this system were not kept')
+        if self._results is None:
+            self._allocate()
+
+    def clear(self):
+        self.size = 0
+        if self.gram is not None:
+            self.gram[:] = 0.0
+            self.moments[:] = 0.0
+
+    def _allocate(self):
+        qtd_variables = self.qtd_variables
+        self.gram = np.zeros((qtd_variables, qtd_variables))
+        self.moments = np.zeros(qtd_variables)
+        if self.keep_equations:
+            self._coeficients = np.empty((self._capacity, qtd_variables))
+            self._results = np.empty(self._capacity)
+
+    def _reserve(self, capacity):
+        if capacity <= self._results.size:
+            return
+        new_capacity = max(capacity, 2 * self._results.size)
+        coeficients = np.empty((new_capacity, self.qtd_variables))
+        coeficients[:self.size] = self.coeficients()
+        results = np.empty(new_capacity)
+        results[:self.size] = self.results()
+        self._coeficients, self._results = coeficients, results
+
+
+def _dense(matrix):
+    return matrix.toarray() if issparse(matrix) else matrix
+
 
 class Recursive(_LSE):
     """ Recursive LSE using a forgeting factor and confidence score """
@@ -16,6 +133,8 @@ class Recursive(_LSE):
     _MAX_CONFIDENCE = 1000
     _MIN_FORGETRATE = 1e-4
     _MAX_FORGETRATE = 1.0
+    # The estimation is refined from the covariances, not the system
+    uses_system = False
 
     def __init__(self, forgetrate, confidence):
         """
@@ -30,26 +149,93 @@ class Recursive(_LSE):
             forgetrate, self._MIN_FORGETRATE, self._MAX_FORGETRATE)
         self.confidence = clip(
             confidence, self._MIN_CONFIDENCE, self._MAX_CONFIDENCE)
+        self.reset()
+
+    def reset(self):
+        """ Restart the estimation from the initial confidence """
+        self.covariances = None
+        self.theta = None
+        self._term = None
+        self._correction = None
+
+    def start_from(self, theta, covariances=None):
+        """ Restart the estimation from the given parameters instead of
+        zeros, with the given covariances or, without them, the initial
+        confidence.
+        """
+        theta = np.ravel(theta)
+        self._allocate(theta.size)
+        self.theta[:] = theta
+        if covariances is not None:
+            self.covariances[:] = covariances
+
+    def _allocate(self, qtd_variables):
+        self.covariances = np.eye(qtd_variables) * self.confidence
+        self.theta = np.zeros(qtd_variables)
+        self._term = np.empty(qtd_variables)
+        self._correction = np.empty((qtd_variables, qtd_variables))
 
     def solve(self, coeficients, results):
         """ Approximate the parameters for the given system, such that
         AX = B + e.
         """
-        qtd_variables = coeficients.shape[1]
-        qtd_equations = coeficients.shape[0]
-        covariances = np.eye(qtd_variables) * self.confidence
-        theta = np.zeros(qtd_variables)
-        for k in range(qtd_equations):
-            coefs_k = np.array([coeficients[k, :]]).T
-            term = covariances @ coefs_k
-            denom = coefs_k.T @ term + self.forgetrate
-            gain = (term / denom).reshape(qtd_variables, )
-            theta += gain*(results[k] - coefs_k.T@theta)
-            part = covariances @ coefs_k @ coefs_k.T @ covariances
-            covariances -= part / denom
-            covariances *= 1.0 / self.forgetrate
+        self.reset()
+        return self.update(coeficients, results).copy()
+
+    def refine(self, linsys, coeficients, results):
+        return self.update(coeficients, results).copy()
+
+    def update(self, coeficients, results):
+        """ Refine the current estimation with new equations of the system,
+        without starting over. Each equation costs a rank-one update of the
+        covariances, done in place.
+
+        Parameters
+        ----------
+        coeficients : numpy.arr of double
+            The new rows of A, or a single row. A scipy.sparse matrix only
+            has its non zero coeficients multiplied.
+        results : numpy.arr of double
+            The new entries of B, or a single entry.
+
+        Returns
+        -------
+        theta : numpy.arr of double
+            The current estimation, updated in place by later calls.
+        """
+        if issparse(coeficients):
+            coeficients = coeficients.tocsr()
+        else:
+            coeficients = np.atleast_2d(coeficients)
+        results = np.atleast_1d(results)
+        if self.theta is None or self.theta.size != coeficients.shape[1]:
+            self._allocate(coeficients.shape[1])
+        covariances, theta, term = self.covariances, self.theta, self._term
+        if issparse(coeficients):
+            indptr = coeficients.indptr
+            for k, result_k in enumerate(results):
+                cols = coeficients.indices[indptr[k]:indptr[k + 1]]
+                coefs_k = coeficients.data[indptr[k]:indptr[k + 1]]
+                np.dot(covariances[:, cols], coefs_k, out=term)
+                residual = result_k - coefs_k @ theta[cols]
+                self._rank_one_update(coefs_k @ term[cols], residual)
+        else:
+            for coefs_k, result_k in zip(coeficients, results):
+                np.dot(covariances, coefs_k, out=term)
+                residual = result_k - coefs_k @ theta
+                self._rank_one_update(coefs_k @ term, residual)
         return theta
 
+    def _rank_one_update(self, spread, residual):
+        # The covariances times the new row are in self._term
+        term, correction = self._term, self._correction
+        denom = spread + self.forgetrate
+        self.theta += term * (residual / denom)
+        np.outer(term, term / denom, out=correction)
+        self.covariances -= correction
+        if self.forgetrate != 1.0:
+            self.covariances *= 1.0 / self.forgetrate
+
 
 def clip(value, lower, upper):
     """ clip a value between lower and upper """
@@ -59,10 +245,159 @@ def clip(value, lower, upper):
 
 
 class Matricial(_LSE):
-    """ A simple matricial solver for AX = B linear systems """
+    """ A matricial solver for AX = B linear systems, using either a Cholesky
+    factorization of the normal equations, a QR factorization of A or a SVD
+    based least squares.
+    """
+    _METHODS = ('auto', 'cholesky', 'qr', 'lstsq')
+    _MAX_CONDITION = 1e10
+
+    def __init__(self, method='auto', ridge=0.0):
+        """
+        Parameters
+        ----------
+        method : string
+            One of 'cholesky', 'qr', 'lstsq' or 'auto'. The automatic method
+            uses lstsq for underdetermined systems and Cholesky otherwise,
+            falling back to lstsq when the normal equations are ill
+            conditioned. Defaults to 'auto'.
+        ridge : double
+            A non negative regularization added to the diagonal of the normal
+            equations. Defaults to zero.
+        """
+        if method not in self._METHODS:
+            raise ValueError('Unknown matricial method {}'.format(method))
+        if ridge < 0:
+            raise ValueError('Negative ridge passed to matricial solver')
+        self.method = method
+        self.ridge = ridge
+        self.reset()
+
+    def reset(self):
+        """ Forget the inverse normal equations kept by refine """
+        self._inverse = None
+        self._factored = 0
 
     def solve(self, coeficients, results):
         """ Approximate parameters X, such that AX = B + e """
-        coeficients_pinverse = minverse(coeficients.T @ coeficients)
-        prediction = coeficients_pinverse @ coeficients.T @ results
-        return prediction
+        coeficients = np.asarray(coeficients, dtype=float)
+        results = np.asarray(results, dtype=float)
+        method = self.method
+        if method == 'auto':
+            overdetermined = coeficients.shape[0] >= coeficients.shape[1]
+            method = 'cholesky' if overdetermined else 'lstsq'
+        if method == 'cholesky':
+            prediction = self._by_cholesky(coeficients, results)
+            if prediction is not None or self.method == 'cholesky':
+                return prediction
+            method = 'lstsq'
+        if self.ridge > 0:
+            coeficients, results = self._ridge_augmented(coeficients, results)
+        if method == 'qr':
+            return self._by_qr(coeficients, results)
+        return np.linalg.lstsq(coeficients, results, rcond=None)[0]
+
+    def solve_system(self, linsys):
+        """ Solve the accumulated normal equations of linsys directly, only
+        going through its equations when they are not reliable.
+        """
+        enough = linsys.size >= linsys.qtd_variables
+        if self.method == 'cholesky' or self.method == 'auto' and enough:
+            prediction = self._by_normal_equations(
+                linsys.gram.copy(), linsys.moments)
+            if prediction is not None:
+                return prediction
+        if not linsys.keep_equations:
+            # The least norm solution of the normal equations is the same as
+            # the one of the system
+            gram = linsys.gram.copy()
+            gram[np.diag_indices_from(gram)] += self.ridge
+            return np.linalg.lstsq(gram, linsys.moments, rcond=None)[0]
+        return self.solve(linsys.coeficients(), linsys.results())
+
+    def refine(self, linsys, coeficients, results):
+        """ Solve linsys right after the given equations were added to it.
+        With the Cholesky methods, the inverse of the normal equations is
+        kept between calls and each new equation updates it by a rank-one
+        term, O(p²) for p variables, as does the product giving the
+        solution. The inverse is computed again from a Cholesky factor,
+        O(p³), when there is none yet, when linsys was not refined by the
+        previous call or when the block has at least p equations. The 'qr'
+        and 'lstsq' methods, and systems without a reliable factor, are
+        solved again by solve_system.
+        """
+        if self.method not in ('auto', 'cholesky'):
+            return self.solve_system(linsys)
+        coeficients = np.atleast_2d(_dense(coeficients))
+        qtd_equations = coeficients.shape[0]
+        if (self._inverse is not None
+                and self._factored + qtd_equations == linsys.size
+                and qtd_equations < linsys.qtd_variables):
+            for row in coeficients:
+                _sherman_morrison(self._inverse, row)
+        else:
+            factor = self._normal_factor(linsys)
+            self._inverse = (None if factor is None else cho_solve(
+                (factor, False), np.eye(linsys.qtd_variables)))
+        self._factored = linsys.size
+        if self._inverse is None:
+            return self.solve_system(linsys)
+        return self._inverse @ linsys.moments
+
+    def _normal_factor(self, linsys):
+        # The upper Cholesky factor of the normal equations of linsys, None
+        # while an automatic solve would not go through them
+        if self.method == 'auto' and linsys.size < linsys.qtd_variables:
+            return None
+        return self._factorized(linsys.gram.copy())
+
+    def _by_cholesky(self, coeficients, results):
+        return self._by_normal_equations(
+            coeficients.T @ coeficients, coeficients.T @ results)
+
+    def _by_normal_equations(self, gram, moments):
+        factor = self._factorized(gram)
+        if factor is None:
+            return None
+        return cho_solve((factor, False), moments)
+
+    def _factorized(self, gram):
+        # None when the factorization fails or is not reliable, unless the
+        # method was explicitly chosen
+        gram[np.diag_indices_from(gram)] += self.ridge
+        try:
+            factor = cholesky(gram, overwrite_a=True)
+        except LinAlgError:
+            if self.method == 'cholesky':
+                raise ValueError('Singular system passed to cholesky solver')
+            return None
+        diagonal = np.abs(np.diag(factor))
+        condition = (diagonal.max() / diagonal.min()) ** 2
+        if self.method == 'auto' and condition > self._MAX_CONDITION:
+            return None
+        return factor
+
+    def _by_qr(self, coeficients, results):
+        # Underdetermined and rank deficient systems have no unique solution
+        # by back substitution, so the least norm one is found by lstsq
+        q_factor, r_factor = qr(coeficients, mode='economic')
+        diagonal = np.abs(np.diag(r_factor))
+        tolerance = np.finfo(float).eps * max(coeficients.shape)
+        if (r_factor.shape[0] < r_factor.shape[1]
+                or diagonal.min() <= tolerance * diagonal.max()):
+            return np.linalg.lstsq(coeficients, results, rcond=None)[0]
+        return solve_triangular(r_factor, q_factor.T @ results)
+
+    def _ridge_augmented(self, coeficients, results):
+        # Solving [A; sqrt(ridge)I]X = [B; 0] is the same as ridge regression
+        qtd_variables = coeficients.shape[1]
+        penalty = np.eye(qtd_variables) * np.sqrt(self.ridge)
+        zeros = np.zeros((qtd_variables, ) + results.shape[1:])
+        return (np.vstack((coeficients, penalty)),
+                np.concatenate((results, zeros)))
+
+
+def _sherman_morrison(inverse, row):
+    # Turn the inverse of G into the one of G + xxᵀ in place
+    term = inverse @ row
+    inverse -= np.outer(term, term / (1.0 + row @ term))
@@ -1,38 +1,334 @@
+from itertools import chain
+import numpy as np
 import anfys.neural.builder as builder
 import anfys.neural.learn as learn
+import anfys.neural.persistence as persistence
+import anfys.lse as lse
+import anfys.fuzzy.mem_funcs as mem_funcs
+from anfys.neural.cache import MembershipCache
+from anfys.neural.frozen import FrozenANFIS
+from anfys.neural.parallel import DataParallelTrainer, predict_by_chunks
+from anfys.neural.profiling import Profiler
 
 
 class ANFIS:
 
-    def __init__(self, subset_size):
+    def __init__(self, subset_size, log_domain=False):
         self.subset_size = subset_size
+        self.log_domain = log_domain
+        # Sparse rule activation, only rules made of the top k mfs of each
+        # input with membership degree above the threshold are evaluated
+        self.rule_threshold = None
+        self.rule_top_k = None
         self.qtd_rules = 0
         self.qtd_inputs = 0
+        # The subset_size may be a single amount of mfs or one per input.
+        # The prem_params rows of input i are mf_offsets[i]:mf_offsets[i+1]
+        self.subset_sizes = []
+        self.mf_offsets = []
+        # Which rules are built, one of builder.RULE_BASES or a
+        # (rules x inputs) table with the mf index of each antecedent. The
+        # 'grid' has a rule per combination of mfs, 'clusters' a rule per
+        # cluster of the training inputs, subset_size being the amount of
+        # clusters, found by subtractive clustering if that is the prem_init
+        # and by k-means otherwise
+        self.rule_base = 'grid'
         self.fuzzysets = []
+        self.rules = []
         self.cons_params = []
         self.prem_params = []
-        self.linsys_coefs = []
-        self.linsys_resul = []
-        self.prem_mf = None
-        self.regressor = None
+        self.linsys = None
+        self.prem_mf = mem_funcs.BellTwo()
+        # How the premise mfs are placed when training starts, one of
+        # builder.PREM_INITS. 'linspace' spreads them evenly over [-1, 1],
+        # 'kmeans' and 'subtractive' cluster each input of the training data
+        self.prem_init = 'linspace'
+        # Name of the tnorm combining the antecedents of a rule, as in
+        # tnorm.ARRAY_TNORMS
+        self.tnorm = 'prod'
+        self.regressor = lse.Recursive(1.0, 1000)
+        # Length of each premise parameters update
+        self.step_size = 0.01
+        self.profiler = None
+        self.membership_cache = None
 
-    def fit_by_hybrid_learn(self, inputs, outputs, max_epochs):
-        builder.configure_model(self, inputs.shape[0])
+    def fit_by_hybrid_learn(self, inputs, outputs, max_epochs,
+                            batch_size=None, monitor=None):
+        """ Train the model with Jang's hybrid learning. Without a
+        batch_size the parameters are updated after every entry, otherwise
+        after each mini-batch. Either way the consequents are estimated from
+        the current epoch only: the regressor starts over every epoch and
+        the linear system holds the equations of the epoch, for regressors
+        that read it. A batch_size as big as the data is the offline hybrid
+        learning. A monitor.TrainingMonitor may stop training early, keeping
+        the best parameters it measured.
+        """
+        builder.configure_model(self, inputs.shape[1], inputs=inputs)
+        _start(monitor)
         epoch = 1
         while epoch <= max_epochs:
-            for entry, output in zip(inputs, outputs):
-                learn.hybrid_online(entry, output)
+            if batch_size is None:
+                self.linsys.clear()
+                self.regressor.reset()
+                for entry, output in zip(inputs, outputs):
+                    learn.hybrid_online(self, entry, output)
+            else:
+                learn.hybrid_offline(self, inputs, outputs, batch_size)
+            if _should_stop(self, monitor, epoch, inputs, outputs):
+                break
             epoch += 1
+        _restore_best(self, monitor)
+
+    def fit_stream(self, chunks, max_epochs, batch_size=None, monitor=None):
+        """ Train the model by mini-batches over an iterable of
+        (inputs, outputs) chunks, e.g. stream.NpyChunks, keeping a single
+        chunk and the normal equations of the consequents in memory. Without
+        a batch_size each chunk is a batch. A one-shot iterator can only be
+        used for a single epoch. Clustered premises are placed from the
+        first chunk. A monitor must hold out a validation set.
+        """
+        if monitor is not None and monitor.validation is None:
+            raise ValueError('Monitoring a stream requires a validation set')
+        iterator = iter(chunks)
+        if iterator is chunks and max_epochs > 1:
+            raise ValueError('Chunks from an iterator can not be repeated '
+                             'for {} epochs'.format(max_epochs))
+        first = next(iterator)
+        builder.configure_model(self, np.shape(first[0])[1],
+                                inputs=first[0])
+        self.linsys = lse.LinearSystem(
+            self.cons_params.size, keep_equations=False)
+        _start(monitor)
+        learn.hybrid_stream(self, chain([first], iterator), batch_size)
+        epoch = 1
+        while not _should_stop(self, monitor, epoch) and epoch < max_epochs:
+            epoch += 1
+            learn.hybrid_stream(self, chunks, batch_size)
+        _restore_best(self, monitor)
+
+    def fit_parallel(self, inputs, outputs, max_epochs, n_jobs=None,
+                     monitor=None):
+        """ Train the model with the offline hybrid learning, sharding the
+        entries among n_jobs processes, which defaults to the amount of CPUs.
+        The consequents must be estimated by a lse.Matricial regressor.
+        """
+        builder.configure_model(self, inputs.shape[1], inputs=inputs)
+        _start(monitor)
+        with DataParallelTrainer(self, inputs, outputs, n_jobs) as trainer:
+            epoch = 1
+            while epoch <= max_epochs:
+                trainer.epoch()
+                if _should_stop(self, monitor, epoch, inputs, outputs):
+                    break
+                epoch += 1
+        _restore_best(self, monitor)
+
+    def partial_fit(self, inputs, outputs, batch_size=None):
+        """ Keep training on new entries from the current parameters,
+        without configuring the model again, a model that was never trained
+        being configured from these entries. The consequents are estimated
+        from the state the regressor and the linear system kept: the
+        covariances of a lse.Recursive regressor, or the normal equations of
+        every entry seen so far. A Recursive regressor whose estimation is
+        not the current consequents, e.g. after load or after a monitor
+        restored earlier ones, starts over from them. Without a batch_size
+        the parameters are updated after every entry.
+        """
+        if self.qtd_inputs and not (self.prem_params.flags.writeable
+                                    and self.cons_params.flags.writeable):
+            raise ValueError('The parameters are read-only, load the model '
+                             'with mmap_mode \'c\' or None to train it')
+        inputs = learn._as_batch(inputs)
+        outputs = np.ravel(outputs)
+        if not self.qtd_inputs:
+            builder.configure_model(self, inputs.shape[1], inputs=inputs)
+        if self.linsys.keep_equations:
+            # Only the normal equations are kept, so memory does not grow
+            # with the entries seen
+            linsys = lse.LinearSystem(
+                self.cons_params.size, keep_equations=False)
+            if self.linsys.gram is not None:
+                linsys.add_normal_equations(
+                    self.linsys.gram, self.linsys.moments, self.linsys.size)
+            self.linsys = linsys
+        regressor = self.regressor
+        if isinstance(regressor, lse.Recursive):
+            if not _estimates(regressor, self.cons_params):
+                regressor.start_from(self.cons_params)
+        size = batch_size or 1
+        for at in range(0, len(inputs), size):
+            until = at + size
+            learn.hybrid_batch(self, inputs[at:until], outputs[at:until])
+
+    def predict(self, inputs, n_jobs=1, chunk_size=None):
+        """ Predict the output of every entry in a (samples x inputs) matrix
+        with a single batched forward pass. Given n_jobs other than one or a
+        chunk_size, the entries are forwarded in chunks by a pool of n_jobs
+        threads, n_jobs None meaning one per CPU.
+        """
+        if n_jobs == 1 and chunk_size is None:
+            return learn.predict(self, inputs)
+        return predict_by_chunks(self, inputs, n_jobs, chunk_size)
+
+    def freeze(self):
+        """ Build an immutable FrozenANFIS with the current parameters, for
+        low latency inference. Sparse rule activation is not supported.
+        """
+        if learn._sparse_activation(self):
+            raise ValueError('Sparse rule activation can not be frozen')
+        prem_params = learn._premise_tensor(self)
+        return FrozenANFIS(self.prem_mf, prem_params, self.rules,
+                           self.cons_params, self.tnorm, self.log_domain)
+
+    def save(self, path):
+        """ Store the model configuration and parameters in a binary file
+        that can be memory-mapped by load. The regressor settings and the
+        state partial_fit continues from, the covariances of a lse.Recursive
+        regressor and the normal equations, are stored as well.
+        """
+        header = {
+            'model': type(self).__name__,
+            'prem_mf': type(self.prem_mf).__name__,
+            'subset_size': np.asarray(self.subset_size).tolist(),
+            'qtd_inputs': self.qtd_inputs,
+            'qtd_rules': self.qtd_rules,
+            'log_domain': self.log_domain,
+            'rule_threshold': self.rule_threshold,
+            'rule_top_k': self.rule_top_k,
+            'rule_base': (self.rule_base if isinstance(self.rule_base, str)
+                          else 'scatter'),
+            'tnorm': self.tnorm,
+            'step_size': self.step_size,
+            'regressor': _regressor_settings(self.regressor),
+            'linsys_size': 0 if self.linsys is None else self.linsys.size
+        }
+        arrays = {'prem_params': self.prem_params, 'rules': self.rules,
+                  'cons_params': self.cons_params}
+        arrays.update(_training_state(self))
+        persistence.write(path, header, arrays)
+
+    @staticmethod
+    def load(path, mmap_mode='r'):
+        """ Load a model stored by save. By default the parameters are
+        memory-mapped read-only, so processes loading the same file share
+        them. Use mmap_mode 'c' (copy-on-write) or None (in memory) to keep
+        training the model.
+        """
+        header, arrays = persistence.read(path, mmap_mode)
+        model = _MODELS[header['model']](
+            header['subset_size'], header['log_domain'])
+        model.prem_mf = getattr(mem_funcs, header['prem_mf'])()
+        for name in ['qtd_inputs', 'qtd_rules', 'rule_threshold',
+                     'rule_top_k', 'tnorm', 'step_size']:
+            setattr(model, name, header[name])
+        state = {name: arrays.pop(name) for name in _TRAINING_STATE
+                 if name in arrays}
+        for name, array in arrays.items():
+            setattr(model, name, array)
+        model.rule_base = header.get('rule_base', 'grid')
+        if model.rule_base == 'scatter':
+            model.rule_base = model.rules
+        settings = header.get('regressor')
+        if settings is not None:
+            model.regressor = getattr(lse, settings['name'])(
+                *settings['values'])
+        builder.configure_loaded_model(model)
+        _restore_training_state(model, state, header.get('linsys_size', 0))
+        return model
+
+    def enable_profiling(self, callback=None):
+        """ Start recording the time spent on each layer and on the LSE.
+        The callback, if any, is called as callback(stage, elapsed, size)
+        after each stage. Returns the Profiler holding the stats.
+        """
+        self.profiler = Profiler(callback)
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def enable_membership_cache(self, resolution=None, max_size=4096):
+        """ Keep the membership degrees and partials of the values seen by
+        each input, rounded to multiples of resolution if given, so repeated
+        values are not evaluated again until the premises change. Returns the
+        MembershipCache holding the hit-rate stats.
+        """
+        self.membership_cache = MembershipCache(resolution, max_size)
+        return self.membership_cache
+
+    def disable_membership_cache(self):
+        self.membership_cache = None
 
     def add_linsys_equation(self, coefs, result):
-        self.linsys_coefs.append(coefs)
-        self.linsys_resul.append(result)
+        self.linsys.add(coefs, result)
 
     def l1size(self):
-        return self.qtd_mfs * self.qtd_mfs
+        return int(np.sum(self.subset_sizes))
 
 
 class Sugeno(ANFIS):
 
-    def __init__(self, subset_size):
-        super().__init__(subset_size)
+    def __init__(self, subset_size, log_domain=False):
+        super().__init__(subset_size, log_domain)
+
+
+def _estimates(regressor, cons_params):
+    # Whether the recursive estimation is the given consequents
+    theta = regressor.theta
+    return theta is not None and np.array_equal(theta, np.ravel(cons_params))
+
+
+def _regressor_settings(regressor):
+    # The name and constructor arguments of the regressors load can build
+    names = _REGRESSOR_SETTINGS.get(type(regressor).__name__)
+    if names is None:
+        return None
+    return {'name': type(regressor).__name__,
+            'values': [getattr(regressor, name) for name in names]}
+
+
+def _training_state(anfis):
+    # The LSE state partial_fit continues from, so a loaded model does not
+    # start estimating the consequents over
+    state = {}
+    regressor = anfis.regressor
+    if (isinstance(regressor, lse.Recursive)
+            and _estimates(regressor, anfis.cons_params)):
+        state['covariances'] = regressor.covariances
+    if anfis.linsys is not None and anfis.linsys.gram is not None:
+        state['gram'] = anfis.linsys.gram
+        state['moments'] = anfis.linsys.moments
+    return state
+
+
+def _restore_training_state(anfis, state, linsys_size):
+    if 'covariances' in state and isinstance(anfis.regressor, lse.Recursive):
+        anfis.regressor.start_from(anfis.cons_params, state['covariances'])
+    if 'gram' in state:
+        anfis.linsys = lse.LinearSystem(
+            anfis.cons_params.size, keep_equations=False)
+        anfis.linsys.add_normal_equations(
+            np.array(state['gram']), np.array(state['moments']),
+            linsys_size)
+
+
+def _start(monitor):
+    if monitor is not None:
+        monitor.start()
+
+
+def _should_stop(anfis, monitor, epoch, inputs=None, outputs=None):
+    if monitor is None:
+        return False
+    return monitor.end_epoch(anfis, epoch, inputs, outputs)
+
+
+def _restore_best(anfis, monitor):
+    if monitor is not None:
+        monitor.restore_best(anfis)
+
+
+_MODELS = {'ANFIS': ANFIS, 'Sugeno': Sugeno}
+_REGRESSOR_SETTINGS = {'Recursive': ('forgetrate', 'confidence'),
+                       'Matricial': ('method', 'ridge')}
+_TRAINING_STATE = ('covariances', 'gram', 'moments')
@@ -1,25 +1,155 @@
 import numpy as np
+import anfys.lse as lse
+import anfys.neural.clustering as clustering
 from anfys.fuzzy.subsets import FuzzySet
 
+PREM_INITS = ('linspace', 'kmeans', 'subtractive')
+RULE_BASES = ('grid', 'clusters')
 
-def configure_model(anfis, qtd_inputs, stdev=1.0):
-    anfis.qtd_rules = qtd_inputs ** anfis.subset_size
+
+def configure_model(anfis, qtd_inputs, stdev=1.0, inputs=None):
     anfis.qtd_inputs = qtd_inputs
+    _build_partitions(anfis, qtd_inputs)
     _build_subsets(anfis, qtd_inputs)
-    _build_prem_params(anfis, stdev)
+    _build_rules(anfis, qtd_inputs)
+    anfis.qtd_rules = len(anfis.rules)
+    _build_prem_params(anfis, stdev, inputs)
     _initialise_cons_params(anfis, qtd_inputs)
+    _initialise_linsys(anfis)
+
+
+def configure_loaded_model(anfis):
+    """ Complete a model whose parameters were loaded, not built """
+    _build_partitions(anfis, anfis.qtd_inputs)
+    _build_subsets(anfis, anfis.qtd_inputs)
+    _initialise_linsys(anfis)
+
+
+def _build_partitions(anfis, qtd_inputs):
+    # The amount of mfs of each input, either the same for all or one per
+    # input, and where the rows of each input start in prem_params, as the
+    # offsets of a CSR matrix
+    sizes = np.array(anfis.subset_size, dtype=int, ndmin=1)
+    if sizes.size == 1:
+        sizes = np.repeat(sizes, qtd_inputs)
+    if sizes.size != qtd_inputs:
+        raise ValueError('Expected {} subset sizes, got {}'.format(
+            qtd_inputs, sizes.size))
+    if np.any(sizes < 1):
+        raise ValueError('Every input needs at least one mf')
+    anfis.subset_sizes = sizes
+    anfis.mf_offsets = np.concatenate(([0], np.cumsum(sizes)))
 
 
 def _build_subsets(anfis, qtd_inputs):
     anfis.fuzzysets = [FuzzySet(anfis.prem_mf) for _ in range(qtd_inputs)]
 
 
-def _build_prem_params(anfis, stdev=1.0):
-    stdevs = np.ones(anfis.l1_size()) * stdev
-    means = np.linspace(-1.0, 1.0, anfis.qtd_mfs)
-    means = np.array(means.tolist() * anfis.qtd_inputs)
+def grid_rule_base(anfis):
+    return _rule_base_is(anfis, 'grid')
+
+
+def _rule_base_is(anfis, name):
+    return isinstance(anfis.rule_base, str) and anfis.rule_base == name
+
+
+def _build_rules(anfis, qtd_inputs):
+    # Row r holds the mf index of each input in rule r
+    if grid_rule_base(anfis):
+        # The first input varying slowest as in itertools.product
+        grid = np.indices(tuple(anfis.subset_sizes))
+        anfis.rules = grid.reshape(qtd_inputs, -1).T
+    elif _rule_base_is(anfis, 'clusters'):
+        _build_cluster_rules(anfis, qtd_inputs)
+    elif isinstance(anfis.rule_base, str):
+        raise ValueError('Unknown rule base {}'.format(anfis.rule_base))
+    else:
+        _build_scatter_rules(anfis, qtd_inputs)
+
+
+def _build_cluster_rules(anfis, qtd_inputs):
+    # Rule k is made of the k-th mf of every input
+    sizes = anfis.subset_sizes
+    if np.any(sizes != sizes[0]):
+        raise ValueError('A clustered rule base needs the same amount of '
+                         'mfs, one per cluster, in every input')
+    clusters = np.arange(sizes[0])
+    anfis.rules = np.repeat(clusters[:, np.newaxis], qtd_inputs, axis=1)
+
+
+def _build_scatter_rules(anfis, qtd_inputs):
+    rules = np.array(anfis.rule_base, dtype=int, ndmin=2)
+    if rules.shape[1] != qtd_inputs:
+        raise ValueError('Each rule needs {} antecedents, not {}'.format(
+            qtd_inputs, rules.shape[1]))
+    if np.any(rules < 0) or np.any(rules >= anfis.subset_sizes):
+        raise ValueError('The rules refer to mfs that do not exist')
+    anfis.rules = rules
+
+
+def _build_prem_params(anfis, stdev=1.0, inputs=None):
+    if anfis.prem_init not in PREM_INITS:
+        raise ValueError('Unknown premise initialisation {}'.format(
+            anfis.prem_init))
+    if _rule_base_is(anfis, 'clusters'):
+        if inputs is None:
+            raise ValueError('A clustered rule base needs the inputs')
+        _cluster_rule_prem_params(anfis, np.asarray(inputs, dtype=float))
+        return
+    if inputs is not None and anfis.prem_init != 'linspace':
+        _cluster_prem_params(anfis, np.asarray(inputs, dtype=float))
+        return
+    stdevs = np.ones(anfis.l1size()) * stdev
+    means = np.concatenate([np.linspace(-1.0, 1.0, size)
+                            for size in anfis.subset_sizes])
     anfis.prem_params = np.vstack((stdevs, means)).T
 
 
+def _cluster_prem_params(anfis, inputs):
+    # One cluster per mf of each input, the mf centered on the cluster and as
+    # wide as its spread. A bell exp(-((x-c)/a)**2) has a = sqrt(2)*stdev
+    stdevs, means = [], []
+    for column, size in zip(inputs.T, anfis.subset_sizes):
+        centers, spreads = _clusters(anfis, column[:, np.newaxis], size)
+        order = np.argsort(centers[:, 0])
+        means.append(centers[order, 0])
+        stdevs.append(np.sqrt(2.0) * spreads[order, 0])
+    anfis.prem_params = np.vstack(
+        (np.concatenate(stdevs), np.concatenate(means))).T
+
+
+def _cluster_rule_prem_params(anfis, inputs):
+    # Cluster the entries in the input space, the k-th mf of each input
+    # being the projection of the k-th cluster on that input
+    centers, spreads = _clusters(anfis, inputs, anfis.subset_sizes[0])
+    anfis.prem_params = np.column_stack(
+        (np.sqrt(2.0) * spreads.T.ravel(), centers.T.ravel()))
+
+
+def _clusters(anfis, data, qtd_clusters):
+    # The centers and spreads of the clusters of the (samples x features)
+    # data. Data with fewer distinct entries than clusters, e.g. a binary
+    # feature, has them spread evenly over its range instead. Subtractive
+    # clustering may not tell apart entries that are too close, which
+    # k-means does
+    if len(np.unique(data, axis=0)) < qtd_clusters:
+        return clustering.even_clusters(data, qtd_clusters)
+    if anfis.prem_init == 'subtractive':
+        try:
+            centers = clustering.subtractive(data, qtd_clusters)
+            labels = clustering.nearest_centers(data, centers)
+            return centers, clustering.cluster_spreads(data, centers, labels)
+        except ValueError:
+            pass
+    centers, labels = clustering.kmeans(data, qtd_clusters, seed=0)
+    return centers, clustering.cluster_spreads(data, centers, labels)
+
+
 def _initialise_cons_params(anfis, qtd_inputs):
-    anfis.cons_params = np.zeros((anfis.qtd_rules, qtd_inputs))
+    # One linear coefficient per input plus the independent term
+    anfis.cons_params = np.zeros((anfis.qtd_rules, qtd_inputs + 1))
+
+
+def _initialise_linsys(anfis):
+    anfis.linsys = lse.LinearSystem(anfis.cons_params.size)
+    anfis.regressor.reset()
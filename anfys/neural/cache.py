@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class MembershipCache:
+    """ A per-input LRU table of membership degrees, log degrees and their
+    partials keyed by input value, so repeated values of quantized features are
+    evaluated once. The tables are dropped whenever the premise parameters
+    differ from the ones they were computed with.
+    """
+
+    def __init__(self, resolution=None, max_size=4096):
+        """
+        Parameters
+        ----------
+        resolution : double
+            Values are rounded to multiples of the resolution, and evaluated
+            at the rounded value. Defaults to None, for exact values.
+        max_size : int
+            The most values kept for each input and kind of evaluation.
+            Defaults to 4096.
+        """
+        if resolution is not None and resolution <= 0:
+            raise ValueError('The resolution must be positive, not {}'.format(
+                resolution))
+        self.resolution = resolution
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._params = None
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def membership_degrees(self, mem_func, values, params):
+        return self._evaluate(mem_func.membership_degrees, 'degrees',
+                              values, params)
+
+    def log_membership_degrees(self, mem_func, values, params):
+        return self._evaluate(mem_func.log_membership_degrees, 'log_degrees',
+                              values, params)
+
+    def partials(self, mem_func, values, params):
+        return self._evaluate(mem_func.partials, 'partials', values, params)
+
+    def log_partials(self, mem_func, values, params):
+        return self._evaluate(mem_func.log_partials, 'log_partials',
+                              values, params)
+
+    def hit_rate(self):
+        """ The share of evaluated values found in the tables """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._params = None
+            self._tables = {}
+
+    def _evaluate(self, func, kind, values, params):
+        # Evaluate each input on its distinct values only, reusing the rows
+        # of the values already in the table
+        values = np.atleast_2d(values)
+        with self._lock:
+            self._check_params(params)
+            columns = []
+            for feat in range(values.shape[1]):
+                keys = values[:, feat]
+                if self.resolution is not None:
+                    keys = np.round(keys / self.resolution)
+                uniques, inverse = np.unique(keys, return_inverse=True)
+                table = self._tables.setdefault((kind, feat), OrderedDict())
+                rows, qtd_missing = self._lookup(
+                    func, table, uniques, params[feat:feat+1])
+                self.misses += qtd_missing
+                self.hits += len(keys) - qtd_missing
+                columns.append(rows[inverse.ravel()])
+            return np.stack(columns, axis=1)
+
+    def _lookup(self, func, table, keys, params):
+        found = [table.get(key) for key in keys.tolist()]
+        missing = [at for at, row in enumerate(found) if row is None]
+        for at, key in enumerate(keys.tolist()):
+            if found[at] is not None:
+                table.move_to_end(key)
+        if missing:
+            points = keys[missing]
+            if self.resolution is not None:
+                points = points * self.resolution
+            computed = func(points[:, np.newaxis], params)[:, 0]
+            for at, row in zip(missing, computed):
+                found[at] = row
+                table[keys[at].item()] = row
+            while len(table) > self.max_size:
+                table.popitem(last=False)
+        return np.array(found), len(missing)
+
+    def _check_params(self, params):
+        if self._params is None or not np.array_equal(self._params, params):
+            if self._tables:
+                self.invalidations += 1
+            self._params = np.array(params)
+            self._tables = {}
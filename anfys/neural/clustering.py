@@ -0,0 +1,162 @@
+""" Vectorized clustering of the training entries, used to place the premise
+mfs where the data is instead of evenly over [-1, 1].
+"""
+import numpy as np
+
+POTENTIAL_CHUNK_SIZE = 1024
+
+
+def kmeans(data, qtd_clusters, max_iter=100, tol=1e-6, seed=None):
+    """ Lloyd's k-means, started from k-means++ seeds.
+
+    Parameters
+    ----------
+    data : numpy.arr of double
+        A (samples x features) matrix, a vector is taken as one feature.
+    qtd_clusters : int
+        The amount of clusters.
+    max_iter : int
+        The most Lloyd iterations. Defaults to 100.
+    tol : double
+        Stop once no center moves more than tol. Defaults to 1e-6.
+    seed : int
+        Seed of the k-means++ sampling. Defaults to None.
+
+    Returns
+    -------
+    centers : numpy.arr of double
+        A (clusters x features) matrix.
+    labels : numpy.arr of int
+        The cluster of each entry.
+    """
+    data = _as_points(data)
+    if not 0 < qtd_clusters <= len(data):
+        raise ValueError('Can not find {} clusters in {} entries'.format(
+            qtd_clusters, len(data)))
+    rng = np.random.default_rng(seed)
+    centers = _kmeans_plus_plus(data, qtd_clusters, rng)
+    for _ in range(max_iter):
+        labels = nearest_centers(data, centers)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=qtd_clusters)[:, np.newaxis]
+        # An empty cluster keeps its center
+        moved = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+        shift = np.max(np.abs(moved - centers))
+        centers = moved
+        if shift <= tol:
+            break
+    return centers, nearest_centers(data, centers)
+
+
+def subtractive(data, qtd_clusters=None, radius=0.5, reject=0.15):
+    """ Chiu's subtractive clustering. Every entry is a candidate center
+    whose potential is its density of neighbours. The entry with the highest
+    potential becomes a center and the potential around it is subtracted,
+    until the amount of clusters is reached or, without one, until the
+    highest potential falls below reject times the first one.
+
+    Parameters
+    ----------
+    data : numpy.arr of double
+        A (samples x features) matrix, a vector is taken as one feature.
+    qtd_clusters : int
+        The amount of clusters. Defaults to None, to find it from reject.
+    radius : double
+        The neighbourhood radius, over the data scaled to [0, 1].
+        Defaults to 0.5.
+    reject : double
+        The potential ratio stopping the search. Defaults to 0.15.
+
+    Returns
+    -------
+    centers : numpy.arr of double
+        A (clusters x features) matrix of entries.
+    """
+    data = _as_points(data)
+    low = data.min(axis=0)
+    span = np.ptp(data, axis=0)
+    points = (data - low) / np.where(span > 0, span, 1.0)
+    alpha = 4.0 / radius**2
+    beta = 4.0 / (1.5*radius)**2
+    potentials = np.empty(len(points))
+    for at in range(0, len(points), POTENTIAL_CHUNK_SIZE):
+        chunk = points[at:at + POTENTIAL_CHUNK_SIZE]
+        potentials[at:at + len(chunk)] = np.exp(
+            -alpha * _squared_distances(chunk, points)).sum(axis=1)
+    first = potentials.max()
+    chosen = []
+    while qtd_clusters is None or len(chosen) < qtd_clusters:
+        best = np.argmax(potentials)
+        highest = potentials[best]
+        if highest <= 0 or (qtd_clusters is None and highest < reject*first):
+            break
+        chosen.append(best)
+        distances = _squared_distances(points[best:best + 1], points)[0]
+        potentials -= highest * np.exp(-beta * distances)
+    if qtd_clusters is not None and len(chosen) < qtd_clusters:
+        raise ValueError('Only {} of {} clusters were found'.format(
+            len(chosen), qtd_clusters))
+    return data[chosen]
+
+
+def nearest_centers(data, centers):
+    return np.argmin(_squared_distances(_as_points(data), centers), axis=1)
+
+
+def cluster_spreads(data, centers, labels):
+    """ The root mean squared distance of the entries of each cluster to its
+    center along every feature. Clusters with no spread get the data span
+    divided by twice the amount of clusters, or one for constant features.
+    """
+    data = _as_points(data)
+    squares = np.zeros_like(centers)
+    np.add.at(squares, labels, (data - centers[labels])**2)
+    counts = np.bincount(labels, minlength=len(centers))[:, np.newaxis]
+    spreads = np.sqrt(squares / np.maximum(counts, 1))
+    span = np.ptp(data, axis=0)
+    fallback = np.where(span > 0, span / (2*len(centers)), 1.0)
+    return np.where(spreads > 0, spreads, fallback)
+
+
+def even_clusters(data, qtd_clusters):
+    """ Centers evenly spaced from the smallest to the largest entry along
+    every feature, for data with fewer distinct entries than clusters. The
+    spreads are the data span divided by twice the amount of clusters, a
+    constant feature being spread over its value plus or minus one.
+    """
+    data = _as_points(data)
+    low, high = data.min(axis=0), data.max(axis=0)
+    constant = high == low
+    low, high = low - constant, high + constant
+    centers = np.linspace(low, high, qtd_clusters)
+    spreads = np.tile((high - low) / (2*qtd_clusters), (qtd_clusters, 1))
+    return centers, spreads
+
+
+def _kmeans_plus_plus(data, qtd_clusters, rng):
+    # Each seed is drawn with probability proportional to its squared
+    # distance to the nearest seed already drawn
+    centers = [data[rng.integers(len(data))]]
+    closest = _squared_distances(data, centers[0][np.newaxis])[:, 0]
+    for _ in range(1, qtd_clusters):
+        total = closest.sum()
+        if total > 0:
+            chosen = rng.choice(len(data), p=closest / total)
+        else:
+            chosen = rng.integers(len(data))
+        centers.append(data[chosen])
+        closest = np.minimum(
+            closest, _squared_distances(data, data[chosen][np.newaxis])[:, 0])
+    return np.array(centers)
+
+
+def _squared_distances(points, centers):
+    distances = (np.sum(points**2, axis=1)[:, np.newaxis]
+                 - 2.0 * points @ centers.T + np.sum(centers**2, axis=1))
+    return np.maximum(distances, 0.0)
+
+
+def _as_points(data):
+    data = np.asarray(data, dtype=float)
+    return data[:, np.newaxis] if data.ndim == 1 else data
@@ -0,0 +1,91 @@
+import numpy as np
+import anfys.fuzzy.operations as operations
+from anfys.fuzzy.operations.tnorm import ARRAY_TNORMS
+
+
+class FrozenANFIS:
+    """ An immutable copy of a trained ANFIS holding only what inference
+    needs, in contiguous read-only arrays. Everything that does not depend on
+    the inputs is resolved when freezing, so predict goes straight through
+    the layers.
+    """
+    __slots__ = ('mem_func', 'prem_params', 'rules', 'cons_params', 'tnorm',
+                 'log_domain', '_degrees', '_columns', '_feats', '_reduce',
+                 '_slopes', '_biases')
+
+    def __init__(self, mem_func, prem_params, rules, cons_params,
+                 tnorm='prod', log_domain=False):
+        """
+        Parameters
+        ----------
+        mem_func : MembershipFunction
+            The premise membership function.
+        prem_params : numpy.arr of double
+            A (inputs x mfs x params) tensor with the premise parameters.
+        rules : numpy.arr of int
+            A (rules x inputs) table with the mf index of each antecedent.
+        cons_params : numpy.arr of double
+            A (rules x inputs + 1) matrix with the consequent parameters, the
+            independent term last.
+        tnorm : string
+            Name of the tnorm combining antecedents. Defaults to 'prod'.
+        log_domain : boolean
+            Whether firing strengths are computed in the log domain. Defaults
+            to False.
+        """
+        if log_domain and tnorm != 'prod':
+            raise ValueError('The log domain requires the prod tnorm')
+        prem_params = _read_only(prem_params)
+        cons_params = _read_only(cons_params)
+        fields = {
+            'mem_func': mem_func,
+            'prem_params': prem_params,
+            'rules': _read_only(rules, dtype=np.intp),
+            'cons_params': cons_params,
+            'tnorm': tnorm,
+            'log_domain': log_domain,
+            '_degrees': mem_func.kernel(prem_params, log_domain),
+            '_columns': tuple(_read_only(prem_params[..., col])
+                              for col in range(prem_params.shape[-1])),
+            '_feats': np.arange(prem_params.shape[0]),
+            '_reduce': _tnorm_reduction(tnorm),
+            '_slopes': _read_only(cons_params[:, :-1].T),
+            '_biases': _read_only(cons_params[:, -1])
+        }
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FrozenANFIS is immutable')
+
+    def predict(self, inputs):
+        """ Predict the output of every entry in a (samples x inputs)
+        matrix, a single entry being taken as one sample.
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.ndim == 1:
+            inputs = inputs[np.newaxis]
+        degrees = self._degrees(inputs[:, :, np.newaxis], *self._columns)
+        antecedents = degrees[:, self._feats, self.rules]
+        if self.log_domain:
+            strengths = antecedents.sum(axis=2)
+            strengths = np.exp(
+                strengths - strengths.max(axis=1, keepdims=True))
+        else:
+            strengths = self._reduce(antecedents, axis=2)
+        consequents = inputs @ self._slopes + self._biases
+        return (np.einsum('nr,nr->n', strengths, consequents)
+                / strengths.sum(axis=1))
+
+
+def _read_only(array, dtype=float):
+    array = np.array(array, dtype=dtype, order='C')
+    array.flags.writeable = False
+    return array
+
+
+def _tnorm_reduction(tnorm):
+    operation = ARRAY_TNORMS[tnorm]
+    if isinstance(operation, np.ufunc):
+        return operation.reduce
+    return lambda values, axis: operations.reduce(operation, values, axis)
@@ -1,6 +1,9 @@
+import time
 import numpy as np
-from itertools import product
-import anfys.lse as regression
+import anfys.fuzzy.operations as operations
+import anfys.neural.builder as builder
+from anfys.fuzzy.operations.tnorm import ARRAY_TNORMS
+from scipy.sparse import csr_matrix, issparse
 from enum import Enum, auto
 
 
@@ -13,62 +16,431 @@ class Layer(Enum):
 
 
 def hybrid_online(anfis, entry, output):
-    l1tol3 = _half_forward_pass(entry, output)
-    l4 = _update_consequent_parameters(anfis, l1tol3, entry, output)
-    l5 = _prediction(l4)
-    return l5
+    return hybrid_batch(anfis, entry, output)[0]
 
 
-def _half_forward_pass(anfis, entry, output):
+def hybrid_offline(anfis, inputs, outputs, batch_size=None):
+    """ Run one epoch of the hybrid learning by mini-batches. The consequents
+    are estimated from the equations of the current epoch only, so a single
+    batch with the whole data is Jang's offline learning.
+
+    Parameters
+    ----------
+    anfis : ANFIS
+        A configured model.
+    inputs : numpy.arr of double
+        A (samples x inputs) matrix.
+    outputs : numpy.arr of double
+        The expected output of each entry.
+    batch_size : int
+        The amount of entries in each batch. Defaults to None, for a single
+        batch.
+    """
+    hybrid_stream(anfis, [(inputs, outputs)], batch_size)
+
+
+def hybrid_stream(anfis, chunks, batch_size=None):
+    """ Run one epoch of the hybrid learning by mini-batches over an
+    iterable of (inputs, outputs) chunks, one chunk in memory at a time.
+    The consequents are estimated from the equations of the current epoch
+    only.
+
+    Parameters
+    ----------
+    anfis : ANFIS
+        A configured model.
+    chunks : iterable of (numpy.arr, numpy.arr)
+        The chunks of entries with their expected outputs.
+    batch_size : int
+        The amount of entries in each batch. Defaults to None, making each
+        chunk a batch.
+    """
+    anfis.linsys.clear()
+    anfis.regressor.reset()
+    for inputs, outputs in chunks:
+        size = batch_size or len(inputs)
+        for at in range(0, len(inputs), size):
+            until = at + size
+            hybrid_batch(anfis, inputs[at:until], outputs[at:until])
+
+
+def hybrid_batch(anfis, inputs, outputs):
+    """ Update the consequents by LSE and then the premises by gradient
+    descent with a single batch, returning its outputs before the premise
+    update.
+    """
+    inputs = _as_batch(inputs)
+    layers = _half_forward_pass(anfis, inputs)
+    _update_consequent_parameters(anfis, layers, inputs, outputs)
+    _complete_forward_pass(anfis, layers, inputs)
+    gradient = _timed(anfis, 'GRADIENT', premise_gradient,
+                      anfis, inputs, outputs, layers)
+    _update_premise_parameters(anfis, gradient)
+    return layers[Layer.OUTPUT]
+
+
+def forward_pass(anfis, inputs):
+    """ Forward a whole batch of entries through the five ANFIS layers.
+
+    Parameters
+    ----------
+    anfis : ANFIS
+        A configured model.
+    inputs : numpy.arr of double
+        A (samples x inputs) matrix, a single entry is taken as one sample.
+
+    Returns
+    -------
+    layers : dict of Layer to numpy.arr of double
+        The output of each layer. The FUZZYFIER output has shape
+        (samples x inputs x mfs), mfs being the largest partition and the mfs
+        an input lacks having degree zero. FIRE, NORMALIZER and DEFUZZIFIER
+        outputs have shape (samples x rules) and the OUTPUT has shape
+        (samples, ). When the model uses sparse rule activation, the rule
+        layers are scipy.sparse.csr_matrix instead.
+    """
+    layers = _half_forward_pass(anfis, inputs)
+    _complete_forward_pass(anfis, layers, inputs)
+    return layers
+
+
+def predict(anfis, inputs):
+    return forward_pass(anfis, inputs)[Layer.OUTPUT]
+
+
+def premise_gradient(anfis, inputs, outputs, layers=None):
+    """ Compute the gradient of the squared error of a whole batch with
+    respect to every premise parameter.
+
+    Parameters
+    ----------
+    anfis : ANFIS
+        A configured model.
+    inputs : numpy.arr of double
+        A (samples x inputs) matrix, a single entry is taken as one sample.
+    outputs : numpy.arr of double
+        The expected output of each entry.
+    layers : dict of Layer to numpy.arr of double
+        The forward pass of the given inputs, computed when not given.
+        Defaults to None.
+
+    Returns
+    -------
+    gradient : numpy.arr of double
+        The derivative of half the sum of squared errors with respect to each
+        premise parameter, shaped as anfis.prem_params.
+    """
+    _check_product_tnorm(anfis, 'premise gradient')
+    inputs = _as_batch(inputs)
+    if layers is None:
+        layers = forward_pass(anfis, inputs)
+    predictions = layers[Layer.OUTPUT]
+    errors = predictions - np.ravel(outputs)
+    # The output changes with the log of a rule firing strength by the rule
+    # normalized strength times the distance of its consequent to the output
+    weights = layers[Layer.NORMALIZER]
+    if issparse(weights):
+        sensitivities = csr_matrix(layers[Layer.DEFUZZIFIER]
+                                   - weights.multiply(predictions[:, None]))
+    else:
+        sensitivities = (layers[Layer.DEFUZZIFIER]
+                         - weights * predictions[:, np.newaxis])
+    sensitivities = _summed_by_antecedent(anfis, sensitivities)
+    # The closed-form log partials hold even where the degrees underflowed,
+    # which dividing the partials by the degrees does not
+    log_partials = _evaluate_mfs(anfis, 'log_partials', inputs)
+    gradient = np.einsum('n,nfm,nfmp->fmp', errors, sensitivities,
+                         log_partials)
+    return _premise_rows(anfis, gradient)
+
+
+def _summed_by_antecedent(anfis, rule_values):
+    # For each input and mf, the sum over the rules having it as antecedent
+    qtd_entries = rule_values.shape[0]
+    qtd_mfs = _largest_partition(anfis)
+    sums = np.empty((qtd_entries, anfis.qtd_inputs, qtd_mfs))
+    memberships = np.eye(qtd_mfs)
+    for n_set in range(anfis.qtd_inputs):
+        sums[:, n_set] = rule_values @ memberships[anfis.rules[:, n_set]]
+    return sums
+
+
+def _update_premise_parameters(anfis, gradient):
+    # Steepest descent with a step of fixed length, as proposed by Jang
+    norm = np.linalg.norm(gradient)
+    if not np.isfinite(norm):
+        raise ValueError('The premise gradient is not finite, check the '
+                         'premise parameters and the inputs')
+    if norm > 0:
+        anfis.prem_params -= (anfis.step_size / norm) * gradient
+
+
+def _half_forward_pass(anfis, inputs):
     # Forward inputs until the third layer
-    layer1 = _fuzzysets_membership_degrees(anfis, entry)
-    layer2 = _rules_fire_strength(layer1)
-    layer3 = _averaged_fire_strength(layer2)
-    return layer1, layer2, layer3
+    inputs = _as_batch(inputs)
+    if _sparse_activation(anfis):
+        _check_product_tnorm(anfis, 'sparse rule activation')
+        if not builder.grid_rule_base(anfis):
+            raise ValueError('Sparse rule activation requires the grid rule '
+                             'base')
+        return _half_forward_pass_with_sparse_rules(anfis, inputs)
+    if anfis.log_domain:
+        _check_product_tnorm(anfis, 'log domain')
+        return _half_forward_pass_in_log_domain(anfis, inputs)
+    layer1 = _timed(anfis, Layer.FUZZYFIER,
+                    _fuzzysets_membership_degrees, anfis, inputs)
+    layer2 = _timed(anfis, Layer.FIRE, _rules_fire_strength, anfis, layer1)
+    layer3 = _timed(anfis, Layer.NORMALIZER, _averaged_fire_strength, layer2)
+    return {Layer.FUZZYFIER: layer1, Layer.FIRE: layer2,
+            Layer.NORMALIZER: layer3}
+
+
+def _half_forward_pass_in_log_domain(anfis, inputs):
+    # Products of many small degrees underflow, so they are summed as logs and
+    # normalized with the log-sum-exp trick instead
+    log_layer1 = _timed(anfis, Layer.FUZZYFIER,
+                        _fuzzysets_log_membership_degrees, anfis, inputs)
+    log_layer2 = _timed(anfis, Layer.FIRE,
+                        _rules_log_fire_strength, anfis, log_layer1)
+    layer3 = _timed(anfis, Layer.NORMALIZER,
+                    _log_averaged_fire_strength, log_layer2)
+    return {Layer.FUZZYFIER: np.exp(log_layer1),
+            Layer.FIRE: np.exp(log_layer2), Layer.NORMALIZER: layer3}
+
+
+def _check_product_tnorm(anfis, feature):
+    if anfis.tnorm != 'prod':
+        raise ValueError('The {} requires the prod tnorm, not {}'.format(
+            feature, anfis.tnorm))
+
+
+def _sparse_activation(anfis):
+    return anfis.rule_threshold is not None or anfis.rule_top_k is not None
+
+
+def _half_forward_pass_with_sparse_rules(anfis, inputs):
+    # Only the combinations of the most activated mfs of each input are
+    # evaluated, each sample activating its own amount of rules
+    log_layer1 = _timed(anfis, Layer.FUZZYFIER,
+                        _fuzzysets_log_membership_degrees, anfis, inputs)
+    indptr, rule_ids, log_strengths = _timed(
+        anfis, Layer.FIRE, _active_rules, anfis, log_layer1)
+    weights = _timed(anfis, Layer.NORMALIZER,
+                     _log_averaged_active_strength, log_strengths, indptr)
+    layer2 = _sparse_rules_layer(
+        anfis, indptr, rule_ids, np.exp(log_strengths))
+    layer3 = _sparse_rules_layer(anfis, indptr, rule_ids, weights)
+    return {Layer.FUZZYFIER: np.exp(log_layer1), Layer.FIRE: layer2,
+            Layer.NORMALIZER: layer3}
+
+
+def _active_rules(anfis, log_mdegrees):
+    # The rules of sample n are the combinations of its kept mfs, the first
+    # counts[n, f] of its ranking of input f. They are laid out as the rows
+    # of a CSR matrix, combination j of sample n being a mixed radix number
+    # over counts[n]
+    top_k = anfis.rule_top_k or _largest_partition(anfis)
+    ranking = np.argsort(-log_mdegrees, axis=2)[..., :top_k]
+    log_mdegrees = np.take_along_axis(log_mdegrees, ranking, axis=2)
+    kept = log_mdegrees > -np.inf  # Padding mfs are never kept
+    if anfis.rule_threshold is not None:
+        kept &= np.exp(log_mdegrees) >= anfis.rule_threshold
+    kept[..., 0] = True  # The best mf of each input is always kept
+    # Degrees are sorted, so the kept mfs are a prefix of each ranking
+    counts = kept.sum(axis=2)
+    strides = np.cumprod(counts[:, :0:-1], axis=1)[:, ::-1]
+    strides = np.hstack((strides, np.ones((len(counts), 1), dtype=int)))
+    qtd_active = strides[:, 0] * counts[:, 0]
+    indptr = np.concatenate(([0], np.cumsum(qtd_active)))
+    samples = np.repeat(np.arange(len(counts)), qtd_active)
+    positions = np.arange(indptr[-1]) - indptr[samples]
+    digits = (positions[:, np.newaxis] // strides[samples]) % counts[samples]
+    feats = np.arange(anfis.qtd_inputs)
+    mfs = ranking[samples[:, np.newaxis], feats, digits]
+    rule_ids = mfs @ _rules_radix(anfis)
+    log_strengths = np.sum(
+        log_mdegrees[samples[:, np.newaxis], feats, digits], axis=1)
+    return indptr, rule_ids, log_strengths
+
+
+def _log_averaged_active_strength(log_strengths, indptr):
+    # The log-sum-exp normalization over the active rules of each sample
+    qtd_active = np.diff(indptr)
+    highest = np.maximum.reduceat(log_strengths, indptr[:-1])
+    shifted = np.exp(log_strengths - np.repeat(highest, qtd_active))
+    totals = np.add.reduceat(shifted, indptr[:-1])
+    return shifted / np.repeat(totals, qtd_active)
+
+
+def _rules_radix(anfis):
+    # Position of a grid rule given the mf index of each input, a mixed radix
+    # number whose digit i goes up to the amount of mfs of input i
+    radix = np.cumprod(anfis.subset_sizes[:0:-1])[::-1]
+    return np.append(radix, 1).astype(int)
+
+
+def _sparse_rules_layer(anfis, indptr, rule_ids, values):
+    layer = csr_matrix((values, rule_ids, indptr),
+                       shape=(len(indptr) - 1, anfis.qtd_rules))
+    layer.eliminate_zeros()
+    return layer
+
+
+def _complete_forward_pass(anfis, layers, inputs):
+    # Forward the third layer of a half forward pass until the output
+    layers[Layer.DEFUZZIFIER] = _timed(
+        anfis, Layer.DEFUZZIFIER, _defuzzified_outputs,
+        anfis, layers[Layer.NORMALIZER], inputs)
+    layers[Layer.OUTPUT] = _timed(
+        anfis, Layer.OUTPUT, _prediction, layers[Layer.DEFUZZIFIER])
+
+
+def _timed(anfis, stage, func, *args):
+    # Call func, recording it in the model profiler when there is one
+    if anfis.profiler is None:
+        return func(*args)
+    start = time.perf_counter()
+    output = func(*args)
+    anfis.profiler.record(stage, time.perf_counter() - start, output)
+    return output
+
+
+def _as_batch(inputs):
+    return np.atleast_2d(np.asarray(inputs, dtype=float))
 
 
 def _fuzzysets_membership_degrees(anfis, inputs):
-    l1size = anfis.l1size()
-    layer1 = np.zeros((l1size, anfis.qtd_mfs))
-    param_range = np.arange(0, l1size + 1, anfis.qtd_mfs)
-    for feat, subset, out in zip(inputs, anfis.sets, range(l1size)):
-        at, untill = param_range[out], param_range[out + 1]
-        output = subset.evaluate(feat, anfis.prem_params[at:untill])
-        layer1[out] = output
-    return layer1
+    mdegrees = _evaluate_mfs(anfis, 'membership_degrees', inputs)
+    return _without_padding(anfis, mdegrees, 0.0)
+
+
+def _fuzzysets_log_membership_degrees(anfis, inputs):
+    log_mdegrees = _evaluate_mfs(anfis, 'log_membership_degrees', inputs)
+    return _without_padding(anfis, log_mdegrees, -np.inf)
+
+
+def _evaluate_mfs(anfis, method, inputs):
+    # Call the batched method of the premise mf, through the membership
+    # cache when there is one
+    params = _premise_tensor(anfis)
+    if anfis.membership_cache is None:
+        return getattr(anfis.prem_mf, method)(inputs, params)
+    return getattr(anfis.membership_cache, method)(
+        anfis.prem_mf, inputs, params)
+
+
+def _uniform_partitions(anfis):
+    return np.all(anfis.subset_sizes == anfis.subset_sizes[0])
+
+
+def _largest_partition(anfis):
+    return int(np.max(anfis.subset_sizes))
+
+
+def _padding(anfis):
+    # Which mfs of the (inputs x mfs) premise tensor do not exist
+    mfs = np.arange(_largest_partition(anfis))
+    return mfs >= anfis.subset_sizes[:, np.newaxis]
+
+
+def _premise_tensor(anfis):
+    # The premise parameters as an (inputs x mfs x params) tensor. Inputs
+    # with fewer mfs than the largest partition are padded with copies of
+    # their last mf, whose degrees are masked out
+    qtd_mfs = _largest_partition(anfis)
+    if _uniform_partitions(anfis):
+        return anfis.prem_params.reshape(anfis.qtd_inputs, qtd_mfs, -1)
+    starts = anfis.mf_offsets[:-1, np.newaxis]
+    rows = starts + np.minimum(np.arange(qtd_mfs),
+                               anfis.subset_sizes[:, np.newaxis] - 1)
+    return anfis.prem_params[rows]
+
+
+def _premise_rows(anfis, tensor):
+    # Back from an (inputs x mfs x params) tensor to the prem_params rows
+    if _uniform_partitions(anfis):
+        return tensor.reshape(anfis.prem_params.shape)
+    return tensor[~_padding(anfis)]
+
+
+def _without_padding(anfis, mdegrees, empty):
+    if _uniform_partitions(anfis):
+        return mdegrees
+    return np.where(_padding(anfis), empty, mdegrees)
 
 
 def _rules_fire_strength(anfis, mdegrees):
-    nodes_id = np.arange(anfis.qtd_mfs)
-    # Create every combination for the given
-    layer2 = []
-    for mf in product(nodes_id, repeat=anfis.qtd_inputs):
-        rule = [mdegrees[n_set, mf[n_set]] for n_set in range(anfis.qtd_sets)]
-        layer2.append(np.prod(rule))
-    return np.array(layer2)
+    # Gather the membership degree of each antecedent of every rule
+    antecedents = mdegrees[:, np.arange(anfis.qtd_inputs), anfis.rules]
+    return operations.reduce(ARRAY_TNORMS[anfis.tnorm], antecedents, axis=2)
+
+
+def _rules_log_fire_strength(anfis, log_mdegrees):
+    antecedents = log_mdegrees[:, np.arange(anfis.qtd_inputs), anfis.rules]
+    return np.sum(antecedents, axis=2)
 
 
 def _averaged_fire_strength(fire_strengths):
-    total_strength = np.sum(fire_strengths)
-    return [rstrength / total_strength for rstrength in fire_strengths]
+    total_strength = np.sum(fire_strengths, axis=1, keepdims=True)
+    return fire_strengths / total_strength
 
 
-def _update_consequent_parameters(anfis, layers, entry, output):
+def _log_averaged_fire_strength(log_fire_strengths):
+    highest = np.max(log_fire_strengths, axis=1, keepdims=True)
+    shifted = np.exp(log_fire_strengths - highest)
+    return shifted / np.sum(shifted, axis=1, keepdims=True)
+
+
+def _defuzzified_outputs(anfis, weights, inputs):
+    extended = _with_independent_term(_as_batch(inputs))
+    if issparse(weights):
+        weights = weights.tocsr()
+        rows = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+        consequents = np.einsum(
+            'ij,ij->i', extended[rows], anfis.cons_params[weights.indices])
+        return csr_matrix(
+            (weights.data * consequents, weights.indices, weights.indptr),
+            shape=weights.shape)
+    return weights * (extended @ anfis.cons_params.T)
+
+
+def _with_independent_term(inputs):
+    return np.hstack((inputs, np.ones((inputs.shape[0], 1))))
+
+
+def design_matrix(anfis, weights, inputs):
+    """ Build the rows of the consequent linear system, one per entry, from
+    the normalized firing strengths. Each row holds the weight of every rule
+    times the entry extended with the independent term. Sparse weights give a
+    sparse design matrix.
+    """
+    extended = _with_independent_term(_as_batch(inputs))
+    width = extended.shape[1]
+    if issparse(weights):
+        weights = weights.tocoo()
+        rows = np.repeat(weights.row, width)
+        cols = (weights.col[:, np.newaxis]*width + np.arange(width)).ravel()
+        data = (weights.data[:, np.newaxis] * extended[weights.row]).ravel()
+        return csr_matrix((data, (rows, cols)),
+                          shape=(extended.shape[0], anfis.qtd_rules*width))
+    coefs = weights[:, :, np.newaxis] * extended[:, np.newaxis, :]
+    return coefs.reshape(extended.shape[0], -1)
+
+
+def _update_consequent_parameters(anfis, layers, inputs, outputs):
     weights = layers[Layer.NORMALIZER]
-    if isinstance(anfis, ):
-        _update_consequent_parameters(anfis, entry, output, weights)
-    else:
-        raise ValueError(
-            'Unkown {} model passed to learn.update_parameters!'.format(anfis))
+    _solve_consequent_system(anfis, inputs, outputs, weights)
 
 
-def _solve_consequent_system(anfis, entry, output, weights):
-    column_weights = np.array([weights]).T
-    coefs = column_weights.dot(entry)
-    anfis.add_linsys_equation(coefs, output)
-    anfis.cons_params = regression.solve(
-        anfis.linsys_coefs, anfis.linsys_resul)
+def _solve_consequent_system(anfis, inputs, outputs, weights):
+    coefs = design_matrix(anfis, weights, inputs)
+    outputs = np.ravel(outputs)
+    if anfis.regressor.uses_system:
+        anfis.add_linsys_equation(coefs, outputs)
+    solution = _timed(anfis, 'LSE', anfis.regressor.refine,
+                      anfis.linsys, coefs, outputs)
+    anfis.cons_params = solution.reshape(anfis.qtd_rules, -1)
 
 
 def _prediction(defuzzified_values):
-    return np.sum(defuzzified_values)
+    return np.asarray(defuzzified_values.sum(axis=1)).ravel()
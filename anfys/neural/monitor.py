@@ -0,0 +1,101 @@
+import numpy as np
+import anfys.neural.learn as learn
+
+
+class TrainingMonitor:
+    """ Measures the error of a model every few epochs of training, with a
+    batched forward pass over held-out entries or, without them, over the
+    training entries. Training stops once the error has not improved for
+    patience checks, and the parameters of the best check are restored at
+    the end. The premise step size is adapted as proposed by Jang: increased
+    by 10% after four reductions of the error in a row and decreased by 10%
+    after two consecutive pairs of an increase and a reduction.
+    """
+
+    def __init__(self, validation=None, patience=5, tol=1e-6, every=1,
+                 adapt_step=True):
+        """
+        Parameters
+        ----------
+        validation : tuple of numpy.arr
+            The (inputs, outputs) held out for validation. Defaults to None,
+            to measure the training error.
+        patience : int
+            The most checks without improvement before stopping. Defaults
+            to 5.
+        tol : double
+            The least error reduction taken as an improvement. Defaults to
+            1e-6.
+        every : int
+            Check the error every this amount of epochs. Defaults to 1.
+        adapt_step : boolean
+            Whether the premise step size follows Jang's rules. Defaults to
+            True.
+        """
+        self.validation = validation
+        self.patience = patience
+        self.tol = tol
+        self.every = every
+        self.adapt_step = adapt_step
+        self.start()
+
+    def start(self):
+        self.history = []
+        self.best_error = np.inf
+        self.best_epoch = 0
+        self.stopped_epoch = None
+        self._best_params = None
+        self._stale = 0
+        self._trend = []
+
+    def end_epoch(self, anfis, epoch, inputs=None, outputs=None):
+        """ Check the error after an epoch, if it is time to, and return
+        whether training should stop.
+        """
+        if epoch % self.every != 0:
+            return False
+        if self.validation is not None:
+            inputs, outputs = self.validation
+        elif inputs is None:
+            raise ValueError('The training error can not be measured '
+                             'without the entries, hold out a validation set')
+        error = _rmse(learn.predict(anfis, inputs), outputs)
+        if self.history:
+            self._trend.append(np.sign(error - self.history[-1][1]))
+        self.history.append((epoch, error))
+        improved = error < self.best_error - self.tol
+        if error < self.best_error:
+            self.best_error = error
+            self.best_epoch = epoch
+            self._best_params = (np.array(anfis.prem_params),
+                                 np.array(anfis.cons_params))
+        self._stale = 0 if improved else self._stale + 1
+        if self.adapt_step:
+            self._adapt_step(anfis)
+        if self._stale >= self.patience:
+            self.stopped_epoch = epoch
+            return True
+        return False
+
+    def restore_best(self, anfis):
+        """ Bring back the parameters with the lowest error measured """
+        if self._best_params is not None:
+            anfis.prem_params = self._best_params[0].copy()
+            anfis.cons_params = self._best_params[1].copy()
+
+    def _adapt_step(self, anfis):
+        trend = self._trend[-4:]
+        if len(trend) < 4:
+            return
+        if all(change < 0 for change in trend):
+            anfis.step_size *= 1.1
+        elif trend in ([1, -1, 1, -1], [-1, 1, -1, 1]):
+            anfis.step_size *= 0.9
+        else:
+            return
+        # Each rule needs four new checks to apply again
+        self._trend = []
+
+
+def _rmse(predictions, outputs):
+    return np.sqrt(np.mean((predictions - np.ravel(outputs))**2))
@@ -0,0 +1,176 @@
+""" Data-parallel hybrid learning and prediction. Both the consequent normal
+equations and the premise gradient are sums over the entries, so each worker
+process computes them for its own shard of the dataset and the parent
+reduces them. The dataset and the parameters live in shared memory, so
+workers see the parameters updated by the parent without copying them.
+Predictions only read the parameters, so they are split among threads, as
+numpy releases the GIL on the layer computations.
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from scipy.sparse import issparse
+import anfys.lse as lse
+import anfys.neural.learn as learn
+from anfys.neural.learn import Layer
+
+_WORKER = {}
+PREDICT_CHUNK_SIZE = 4096
+
+
+def predict_by_chunks(anfis, inputs, n_jobs=None, chunk_size=None):
+    """ Predict the outputs of a (samples x inputs) matrix in chunks of
+    chunk_size entries, forwarded by n_jobs threads. Chunks should be small
+    enough to keep the layers of a chunk in cache. n_jobs defaults to the
+    amount of CPUs and chunk_size to PREDICT_CHUNK_SIZE.
+    """
+    chunk_size = chunk_size or PREDICT_CHUNK_SIZE
+    inputs = learn._as_batch(inputs)
+    predictions = np.empty(inputs.shape[0])
+
+    def forward(at):
+        until = at + chunk_size
+        predictions[at:until] = learn.predict(anfis, inputs[at:until])
+
+    with ThreadPoolExecutor(n_jobs or os.cpu_count()) as pool:
+        list(pool.map(forward, range(0, inputs.shape[0], chunk_size)))
+    return predictions
+
+
+class DataParallelTrainer:
+    """ Runs epochs of the offline hybrid learning on a pool of processes.
+    While the trainer is open, the model parameters are backed by shared
+    memory, close it (or use it as a context manager) to bring them back.
+    """
+
+    def __init__(self, anfis, inputs, outputs, n_jobs=None, chunk_size=1024):
+        """
+        Parameters
+        ----------
+        anfis : ANFIS
+            A configured model, estimating consequents with lse.Matricial.
+        inputs : numpy.arr of double
+            A (samples x inputs) matrix.
+        outputs : numpy.arr of double
+            The expected output of each entry.
+        n_jobs : int
+            The amount of worker processes. Defaults to the amount of CPUs.
+        chunk_size : int
+            The most entries a worker forwards at once. Defaults to 1024.
+        """
+        if not isinstance(anfis.regressor, lse.Matricial):
+            raise ValueError('Data-parallel training requires a Matricial '
+                             'regressor to solve the normal equations')
+        n_jobs = n_jobs or os.cpu_count()
+        self.anfis = anfis
+        self._memories = []
+        blocks = {}
+        arrays = {'inputs': np.asarray(inputs, dtype=float),
+                  'outputs': np.ravel(outputs).astype(float),
+                  'prem_params': anfis.prem_params,
+                  'cons_params': anfis.cons_params}
+        for name, array in arrays.items():
+            blocks[name], shared = self._share(array)
+            if name.endswith('params'):
+                setattr(anfis, name, shared)
+        anfis.linsys = lse.LinearSystem(
+            anfis.cons_params.size, keep_equations=False)
+        bounds = np.linspace(0, len(arrays['inputs']), n_jobs + 1, dtype=int)
+        self._shards = [(at, until) for at, until in zip(bounds, bounds[1:])
+                        if until > at]
+        template = copy.copy(anfis)
+        template.profiler = None
+        template.membership_cache = None
+        template.linsys = None
+        self._pool = ProcessPoolExecutor(
+            n_jobs, initializer=_attach,
+            initargs=(template, blocks, chunk_size))
+
+    def _share(self, array):
+        memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._memories.append(memory)
+        shared = np.ndarray(array.shape, array.dtype, buffer=memory.buf)
+        shared[...] = array
+        return (memory.name, array.shape, array.dtype.str), shared
+
+    def epoch(self):
+        """ Estimate the consequents from all the entries and then take one
+        premise gradient step. Returns the sum of squared errors with the new
+        consequents, before the premise step.
+        """
+        anfis = self.anfis
+        anfis.linsys.clear()
+        for gram, moments, size in self._pool.map(
+                _normal_equations, self._shards):
+            anfis.linsys.add_normal_equations(gram, moments, size)
+        solution = anfis.regressor.solve_system(anfis.linsys)
+        anfis.cons_params[...] = solution.reshape(anfis.cons_params.shape)
+        gradient = np.zeros_like(anfis.prem_params)
+        squared_error = 0.0
+        for shard_gradient, shard_error in self._pool.map(
+                _premise_gradient, self._shards):
+            gradient += shard_gradient
+            squared_error += shard_error
+        learn._update_premise_parameters(anfis, gradient)
+        return squared_error
+
+    def close(self):
+        self._pool.shutdown()
+        self.anfis.prem_params = np.array(self.anfis.prem_params)
+        self.anfis.cons_params = np.array(self.anfis.cons_params)
+        for memory in self._memories:
+            memory.close()
+            memory.unlink()
+        self._memories = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _attach(template, blocks, chunk_size):
+    arrays = {}
+    for name, (memory_name, shape, dtype) in blocks.items():
+        memory = SharedMemory(name=memory_name)
+        _WORKER.setdefault('memories', []).append(memory)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=memory.buf)
+    template.prem_params = arrays['prem_params']
+    template.cons_params = arrays['cons_params']
+    _WORKER.update(model=template, inputs=arrays['inputs'],
+                   outputs=arrays['outputs'], chunk_size=chunk_size)
+
+
+def _chunks(bounds):
+    at, until = bounds
+    step = _WORKER['chunk_size']
+    for start in range(at, until, step):
+        stop = min(start + step, until)
+        yield _WORKER['inputs'][start:stop], _WORKER['outputs'][start:stop]
+
+
+def _normal_equations(bounds):
+    model = _WORKER['model']
+    gram = np.zeros((model.cons_params.size, model.cons_params.size))
+    moments = np.zeros(model.cons_params.size)
+    for inputs, outputs in _chunks(bounds):
+        layers = learn._half_forward_pass(model, inputs)
+        coefs = learn.design_matrix(model, layers[Layer.NORMALIZER], inputs)
+        partial_gram = coefs.T @ coefs
+        gram += partial_gram.toarray() if issparse(coefs) else partial_gram
+        moments += coefs.T @ outputs
+    return gram, moments, bounds[1] - bounds[0]
+
+
+def _premise_gradient(bounds):
+    model = _WORKER['model']
+    gradient = np.zeros_like(model.prem_params)
+    squared_error = 0.0
+    for inputs, outputs in _chunks(bounds):
+        layers = learn.forward_pass(model, inputs)
+        gradient += learn.premise_gradient(model, inputs, outputs, layers)
+        squared_error += np.sum((layers[Layer.OUTPUT] - outputs)**2)
+    return gradient, squared_error
@@ -0,0 +1,81 @@
+""" A versioned binary format for ANFIS models. A file starts with a magic
+string, the format version and the length of a JSON header, followed by the
+header itself. The arrays come next, stored raw in C order, each one aligned
+to 64 bytes so they can be memory-mapped and shared between processes.
+"""
+import json
+import struct
+import numpy as np
+
+FORMAT_VERSION = 1
+_MAGIC = b'ANFYS\x00\x00\x00'
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGNMENT = 64
+
+
+def write(path, header, arrays):
+    """ Write a header dict and a dict of named arrays to path """
+    arrays = {name: np.ascontiguousarray(array)
+              for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': array.shape,
+                        'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    header = dict(header, arrays=layout)
+    encoded = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as stream:
+        stream.write(_PREAMBLE.pack(_MAGIC, FORMAT_VERSION, len(encoded)))
+        stream.write(encoded)
+        data_start = _aligned(_PREAMBLE.size + len(encoded))
+        for name, array in arrays.items():
+            stream.seek(data_start + layout[name]['offset'])
+            stream.write(array.tobytes())
+
+
+def read(path, mmap_mode='r'):
+    """ Read a file written by write.
+
+    Parameters
+    ----------
+    path : string
+        The file path.
+    mmap_mode : string
+        The numpy.memmap mode of the arrays, 'r' for read-only or 'c' for
+        copy-on-write. None reads the arrays into memory. Defaults to 'r'.
+
+    Returns
+    -------
+    header : dict
+        The header, without the arrays layout.
+    arrays : dict of string to numpy.arr
+        The stored arrays.
+    """
+    with open(path, 'rb') as stream:
+        magic, version, length = _PREAMBLE.unpack(
+            stream.read(_PREAMBLE.size))
+        if magic != _MAGIC:
+            raise ValueError('{} is not an anfys model file'.format(path))
+        if version > FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported model format version {}'.format(version))
+        header = json.loads(stream.read(length).decode('utf-8'))
+        data_start = _aligned(_PREAMBLE.size + length)
+        arrays = {}
+        for name, spec in header.pop('arrays').items():
+            arrays[name] = _read_array(
+                stream, path, data_start + spec['offset'],
+                np.dtype(spec['dtype']), tuple(spec['shape']), mmap_mode)
+    return header, arrays
+
+
+def _read_array(stream, path, offset, dtype, shape, mmap_mode):
+    if mmap_mode is None or 0 in shape:
+        stream.seek(offset)
+        count = int(np.prod(shape))
+        return np.fromfile(stream, dtype, count).reshape(shape)
+    return np.memmap(path, dtype, mmap_mode, offset, shape)
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
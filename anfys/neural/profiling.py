@@ -0,0 +1,72 @@
+import threading
+import numpy as np
+from scipy.sparse import issparse
+
+
+class StageStats:
+    """ Accumulated measures of a single stage """
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.total_size = 0
+        self.last_size = 0
+
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class Profiler:
+    """ Records wall time, call counts and output sizes of each stage of an
+    ANFIS. Stages are named after the Layer enum, plus LSE for the consequent
+    estimation and GRADIENT for the premise gradient. Records may come from
+    several threads, e.g. predicting by chunks.
+    """
+
+    def __init__(self, callback=None):
+        """
+        Parameters
+        ----------
+        callback : callable
+            Called as callback(stage, elapsed, size) after every record.
+            Defaults to None.
+        """
+        self.callback = callback
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, elapsed, output):
+        stage = getattr(stage, 'name', stage)
+        size = _size(output)
+        with self._lock:
+            stats = self.stats.setdefault(stage, StageStats())
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.total_size += size
+            stats.last_size = size
+        if self.callback is not None:
+            self.callback(stage, elapsed, size)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def summary(self):
+        """ A text table with the stats of each stage, slowest first """
+        lines = ['{:<12} {:>8} {:>12} {:>12} {:>12}'.format(
+            'stage', 'calls', 'total (s)', 'mean (ms)', 'last size')]
+        by_time = sorted(self.stats.items(),
+                         key=lambda item: item[1].total_time, reverse=True)
+        for stage, stats in by_time:
+            lines.append('{:<12} {:>8} {:>12.4f} {:>12.4f} {:>12}'.format(
+                stage, stats.calls, stats.total_time,
+                1e3 * stats.mean_time(), stats.last_size))
+        return '\n'.join(lines)
+
+
+def _size(output):
+    if isinstance(output, (tuple, list)):
+        return sum(_size(item) for item in output)
+    if issparse(output):
+        return output.nnz
+    return np.size(output)
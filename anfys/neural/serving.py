@@ -0,0 +1,81 @@
+import asyncio
+import numpy as np
+
+
+class MicroBatchPredictor:
+    """ Collects concurrent single entry predictions into micro-batches,
+    forwarded at once by a batched predict running in an executor. A batch is
+    sent as soon as it reaches max_batch_size entries, or max_wait seconds
+    after its first entry arrived.
+    """
+
+    def __init__(self, model, max_batch_size=64, max_wait=0.002,
+                 executor=None):
+        """
+        Parameters
+        ----------
+        model : ANFIS or FrozenANFIS
+            Any model with a batched predict(inputs).
+        max_batch_size : int
+            The most entries in a batch. Defaults to 64.
+        max_wait : double
+            The most seconds an entry waits for others. Defaults to 0.002.
+        executor : concurrent.futures.Executor
+            Where batches are predicted. Defaults to None, the event loop
+            default executor.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.qtd_batches = 0
+        self.qtd_requests = 0
+        self._pending = []
+        self._timer = None
+        self._running = set()
+
+    async def predict(self, entry):
+        """ Predict the output of a single entry """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((np.asarray(entry, dtype=float), future))
+        self.qtd_requests += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    async def close(self):
+        """ Send the pending entries and wait for every batch to finish """
+        self._flush()
+        while self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = loop.create_task(self._predict_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _predict_batch(self, batch):
+        self.qtd_batches += 1
+        loop = asyncio.get_running_loop()
+        try:
+            inputs = np.vstack([entry for entry, _ in batch])
+            outputs = await loop.run_in_executor(
+                self.executor, self.model.predict, inputs)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(float(output))
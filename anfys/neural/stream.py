@@ -0,0 +1,39 @@
+""" Sources of (inputs, outputs) chunks for training on datasets that do not
+fit in memory. Both sources can be iterated again for every epoch.
+"""
+import numpy as np
+
+
+class ArrayChunks:
+    """ Split a pair of arrays, possibly memory-mapped, in chunks of rows.
+    Only the current chunk is brought into memory.
+    """
+
+    def __init__(self, inputs, outputs, chunk_size):
+        if len(inputs) != len(outputs):
+            raise ValueError('Inputs and outputs have different lengths')
+        self.inputs = inputs
+        self.outputs = outputs
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for at in range(0, len(self.inputs), self.chunk_size):
+            until = at + self.chunk_size
+            yield (np.asarray(self.inputs[at:until], dtype=float),
+                   np.asarray(self.outputs[at:until], dtype=float))
+
+
+class NpyChunks:
+    """ Chunks of rows from a pair of .npy files, which are memory-mapped
+    instead of loaded.
+    """
+
+    def __init__(self, inputs_path, outputs_path, chunk_size):
+        self.inputs_path = inputs_path
+        self.outputs_path = outputs_path
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        inputs = np.load(self.inputs_path, mmap_mode='r')
+        outputs = np.load(self.outputs_path, mmap_mode='r')
+        return iter(ArrayChunks(inputs, outputs, self.chunk_size))
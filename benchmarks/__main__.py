@@ -0,0 +1,70 @@
+""" Run the benchmarks of the training and inference hot paths.
+
+    python -m benchmarks [--quick] [--stage NAME] [--output FILE]
+                         [--compare FILE] [--tolerance FRACTION]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+from benchmarks.runner import measure, regressions
+from benchmarks.suite import cases, FULL_GRID, QUICK_GRID
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    selected = [case for case in cases(grid)
+                if args.stage is None or case.stage in args.stage]
+    results = {'meta': _metadata(), 'results': []}
+    for case in selected:
+        result = measure(case, repeat=args.repeat)
+        results['results'].append(result)
+        _report(result)
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, default=float)
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            slower = regressions(results, json.load(baseline), args.tolerance)
+        for name, ratio in slower:
+            print('REGRESSION {} is {:.2f}x slower'.format(name, ratio))
+        return 1 if slower else 0
+    return 0
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks')
+    parser.add_argument('--quick', action='store_true',
+                        help='run a single small configuration')
+    parser.add_argument('--stage', action='append',
+                        help='only run the given stage, may be repeated')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='store the results as JSON')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown fraction reported as regression')
+    return parser.parse_args(argv)
+
+
+def _metadata():
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform()
+    }
+
+
+def _report(result):
+    print('{:<60} {:>12.1f} items/s  p50 {:>9.3f} ms  p99 {:>9.3f} ms  '
+          'peak {:>8.1f} KiB'.format(
+              result['name'], result['throughput'],
+              1e3 * result['latency']['p50'], 1e3 * result['latency']['p99'],
+              result['peak_memory'] / 1024))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
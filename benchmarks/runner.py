@@ -0,0 +1,88 @@
+import time
+import tracemalloc
+import numpy as np
+
+
+class Case:
+    """ A benchmark case. The setup builds everything the case needs and
+    returns a callable, which is the only thing timed. Each call of it
+    processes qtd_items items, e.g. entries of a dataset.
+    """
+
+    def __init__(self, stage, params, setup, qtd_items, calls=1):
+        self.stage = stage
+        self.params = params
+        self.setup = setup
+        self.qtd_items = qtd_items
+        self.calls = calls
+
+    def name(self):
+        params = ','.join('{}={}'.format(k, v) for k, v in self.params.items())
+        return '{}[{}]'.format(self.stage, params)
+
+
+def measure(case, repeat=5):
+    """ Time a case and trace its peak memory.
+
+    Parameters
+    ----------
+    case : Case
+        The benchmark case.
+    repeat : int
+        How many times the setup is run. Each setup result is called
+        case.calls times. Defaults to 5.
+
+    Returns
+    -------
+    result : dict
+        The stage, params, throughput in items per second, latency
+        percentiles in seconds and peak memory in bytes of the case.
+    """
+    latencies = []
+    for _ in range(repeat):
+        run = case.setup()
+        for _ in range(case.calls):
+            start = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies)
+    return {
+        'name': case.name(),
+        'stage': case.stage,
+        'params': case.params,
+        'throughput': case.qtd_items / np.median(latencies),
+        'latency': {
+            'p50': np.percentile(latencies, 50),
+            'p90': np.percentile(latencies, 90),
+            'p99': np.percentile(latencies, 99),
+            'mean': latencies.mean()
+        },
+        'peak_memory': _peak_memory(case)
+    }
+
+
+def _peak_memory(case):
+    run = case.setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def regressions(results, baseline, tolerance=0.1):
+    """ List the cases whose median latency grew more than the tolerance
+    fraction with respect to a baseline run, as (name, ratio) pairs.
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    slower = []
+    for result in results['results']:
+        if result['name'] not in previous:
+            continue
+        before = previous[result['name']]['latency']['p50']
+        ratio = result['latency']['p50'] / before
+        if ratio > 1.0 + tolerance:
+            slower.append((result['name'], ratio))
+    return slower
@@ -0,0 +1,108 @@
+from itertools import product
+import numpy as np
+import anfys.lse as lse
+import anfys.neural.anfis as anfis
+import anfys.neural.builder as builder
+import anfys.neural.learn as learn
+from benchmarks.runner import Case
+
+
+FULL_GRID = {'inputs': [2, 4], 'mfs': [2, 3], 'samples': [200, 2000]}
+QUICK_GRID = {'inputs': [2], 'mfs': [2], 'samples': [100]}
+
+
+def synthetic_dataset(qtd_inputs, qtd_samples, seed=0):
+    """ Uniform inputs in [-1, 1] with a smooth non linear target """
+    rng = np.random.default_rng(seed)
+    inputs = rng.uniform(-1.0, 1.0, (qtd_samples, qtd_inputs))
+    outputs = np.sin(np.pi * inputs[:, 0]) + np.sum(inputs[:, 1:]**2, axis=1)
+    return inputs, outputs
+
+
+def trained_model(qtd_inputs, qtd_mfs, inputs, outputs):
+    model = anfis.Sugeno(qtd_mfs)
+    model.regressor = lse.Matricial()
+    builder.configure_model(model, qtd_inputs)
+    learn.hybrid_offline(model, inputs, outputs)
+    return model
+
+
+def cases(grid):
+    """ Build every benchmark case for each combination of the grid """
+    all_cases = []
+    for qtd_inputs, qtd_mfs, qtd_samples in product(
+            grid['inputs'], grid['mfs'], grid['samples']):
+        params = {'inputs': qtd_inputs, 'mfs': qtd_mfs,
+                  'samples': qtd_samples}
+        inputs, outputs = synthetic_dataset(qtd_inputs, qtd_samples)
+        model = trained_model(qtd_inputs, qtd_mfs, inputs, outputs)
+        all_cases += _model_cases(params, model, inputs, outputs)
+        all_cases += _lse_cases(params, model, inputs, outputs)
+    return all_cases
+
+
+def _model_cases(params, model, inputs, outputs):
+    qtd_inputs, qtd_mfs = params['inputs'], params['mfs']
+    qtd_samples = params['samples']
+    prem_params = model.prem_params.reshape(qtd_inputs, qtd_mfs, -1)
+
+    def evaluate():
+        fuzzyset = model.fuzzysets[0]
+        return lambda: [fuzzyset.evaluate(value, prem_params[0])
+                        for value in inputs[:, 0]]
+
+    def membership():
+        return lambda: model.prem_mf.membership_degrees(inputs, prem_params)
+
+    def forward():
+        return lambda: learn.forward_pass(model, inputs)
+
+    def predict_entry():
+        entry = inputs[:1]
+        return lambda: model.predict(entry)
+
+    def frozen_predict_entry():
+        frozen, entry = model.freeze(), inputs[:1]
+        return lambda: frozen.predict(entry)
+
+    def online():
+        fresh = anfis.Sugeno(qtd_mfs)
+        builder.configure_model(fresh, qtd_inputs)
+
+        def run():
+            for entry, output in zip(inputs, outputs):
+                learn.hybrid_online(fresh, entry, output)
+        return run
+
+    def offline():
+        fresh = anfis.Sugeno(qtd_mfs)
+        fresh.regressor = lse.Matricial()
+        builder.configure_model(fresh, qtd_inputs)
+        return lambda: learn.hybrid_offline(fresh, inputs, outputs)
+
+    return [
+        Case('fuzzyset_evaluate', params, evaluate, qtd_samples),
+        Case('membership_degrees', params, membership, qtd_samples),
+        Case('forward_pass', params, forward, qtd_samples),
+        Case('predict_entry', params, predict_entry, 1, calls=50),
+        Case('frozen_predict_entry', params, frozen_predict_entry, 1,
+             calls=50),
+        Case('hybrid_online', params, online, qtd_samples),
+        Case('hybrid_offline', params, offline, qtd_samples)
+    ]
+
+
+def _lse_cases(params, model, inputs, outputs):
+    layers = learn.forward_pass(model, inputs)
+    coefs = learn.design_matrix(model, layers[learn.Layer.NORMALIZER], inputs)
+
+    def recursive():
+        return lambda: lse.Recursive(1.0, 1000).solve(coefs, outputs)
+
+    def matricial():
+        return lambda: lse.Matricial().solve(coefs, outputs)
+
+    return [
+        Case('recursive_solve', params, recursive, params['samples']),
+        Case('matricial_solve', params, matricial, params['samples'])
+    ]
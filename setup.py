@@ -20,5 +20,5 @@ setup(
     author_email='thalesaguiar21@gmail.com',
     url='https://github.com/thalesaguiar21/Anfys',
     license=license,
-    packages=find_packages(exclude=('tests', 'docs'))
+    packages=find_packages(exclude=('tests', 'docs', 'benchmarks'))
 )
@@ -2,6 +2,7 @@ from .context import anfys
 import anfys.lse as lse
 import unittest
 import numpy as np
+from scipy.sparse import csr_matrix
 
 
 class TestMatrix(unittest.TestCase):
@@ -21,7 +22,46 @@ class TestMatrix(unittest.TestCase):
         assertSequenceAlmostEqual(self, expected, res)
 
     def test_matricial_underdetermined(self):
-        pass
+        coef_matrix = np.array([[1, 1]])
+        rs_matrix = np.array([2])
+        res = lse.Matricial().solve(coef_matrix, rs_matrix)
+        assertSequenceAlmostEqual(self, [1.0, 1.0], res)
+
+    def test_matricial_methods_agree(self):
+        coef_matrix = np.array([[1, -1], [1, 1], [2, 1]])
+        rs_matrix = np.array([2, 4, 8])
+        expected = [23 / 7, 8 / 7]
+        for method in ['cholesky', 'qr', 'lstsq']:
+            res = lse.Matricial(method).solve(coef_matrix, rs_matrix)
+            assertSequenceAlmostEqual(self, expected, res)
+
+    def test_matricial_singular(self):
+        coef_matrix = np.array([[1, 1], [2, 2], [3, 3]])
+        rs_matrix = np.array([2, 4, 6])
+        res = lse.Matricial().solve(coef_matrix, rs_matrix)
+        assertSequenceAlmostEqual(self, [1.0, 1.0], res)
+
+    def test_qr_without_unique_solution(self):
+        qr = lse.Matricial('qr')
+        assertSequenceAlmostEqual(
+            self, [1.0, 1.0], qr.solve(np.array([[1, 1]]), np.array([2])))
+        assertSequenceAlmostEqual(
+            self, [1.0, 1.0],
+            qr.solve(np.array([[1, 1], [2, 2], [3, 3]]), np.array([2, 4, 6])))
+
+    def test_matricial_ridge(self):
+        coef_matrix = np.array([[1, -1], [1, 1], [2, 1]])
+        rs_matrix = np.array([2, 4, 8])
+        cholesky = lse.Matricial('cholesky', ridge=0.5)
+        qr = lse.Matricial('qr', ridge=0.5)
+        res = cholesky.solve(coef_matrix, rs_matrix)
+        assertSequenceAlmostEqual(
+            self, res, qr.solve(coef_matrix, rs_matrix))
+        self.assertLess(np.linalg.norm(res), np.linalg.norm([23 / 7, 8 / 7]))
+
+    def test_matricial_unknown_method(self):
+        with self.assertRaises(ValueError):
+            lse.Matricial('inverse')
 
 
 class TestRecursive(unittest.TestCase):
@@ -40,6 +80,109 @@ class TestRecursive(unittest.TestCase):
         res = lse.Recursive(1.0, 1000).solve(coef_matrix, rs_matrix)
         assertSequenceAlmostEqual(self, expected, res, tolerance=2)
 
+    def test_recursive_incremental_update(self):
+        coef_matrix = np.array([[1, -1], [1, 1], [2, 1], [3, -2]])
+        rs_matrix = np.array([2, 4, 8, 1])
+        expected = lse.Recursive(0.9, 1000).solve(coef_matrix, rs_matrix)
+        estimator = lse.Recursive(0.9, 1000)
+        estimator.update(coef_matrix[:3], rs_matrix[:3])
+        res = estimator.update(coef_matrix[3], rs_matrix[3])
+        assertSequenceAlmostEqual(self, expected, res)
+
+    def test_recursive_solve_restarts(self):
+        coef_matrix = np.array([[1, -1], [1, 1], [2, 1]])
+        rs_matrix = np.array([2, 4, 8])
+        estimator = lse.Recursive(1.0, 1000)
+        first = estimator.solve(coef_matrix, rs_matrix)
+        second = estimator.solve(coef_matrix, rs_matrix)
+        assertSequenceAlmostEqual(self, first, second)
+
+    def test_recursive_sparse_rows(self):
+        coef_matrix = np.array([[1, 0, 0], [0, 2, 1], [3, 0, 1], [0, 0, 2]])
+        rs_matrix = np.array([2, 4, 8, 1])
+        expected = lse.Recursive(0.9, 1000).solve(coef_matrix, rs_matrix)
+        res = lse.Recursive(0.9, 1000).solve(
+            csr_matrix(coef_matrix), rs_matrix)
+        assertSequenceAlmostEqual(self, expected, res)
+
+    def test_recursive_start_from(self):
+        estimator = lse.Recursive(1.0, 1000)
+        estimator.start_from([2.0, 1.0])
+        res = estimator.update(np.array([[1, 1], [3, -1]]), [3, 5])
+        assertSequenceAlmostEqual(self, [2.0, 1.0], res)
+
+
+class TestLinearSystem(unittest.TestCase):
+
+    def setUp(self):
+        self.coef_matrix = np.array([[1, -1], [1, 1], [2, 1], [3, -2]])
+        self.rs_matrix = np.array([2, 4, 8, 1])
+
+    def test_growing_buffers(self):
+        linsys = lse.LinearSystem(2, capacity=1)
+        linsys.add(self.coef_matrix[0], self.rs_matrix[0])
+        linsys.add(self.coef_matrix[1:], self.rs_matrix[1:])
+        self.assertEqual(linsys.size, 4)
+        np.testing.assert_array_equal(linsys.coeficients(), self.coef_matrix)
+        np.testing.assert_array_equal(linsys.results(), self.rs_matrix)
+        np.testing.assert_allclose(
+            linsys.gram, self.coef_matrix.T @ self.coef_matrix)
+        np.testing.assert_allclose(
+            linsys.moments, self.coef_matrix.T @ self.rs_matrix)
+
+    def test_solve_accumulated_system(self):
+        linsys = lse.LinearSystem(2)
+        for coefs, result in zip(self.coef_matrix, self.rs_matrix):
+            linsys.add(coefs, result)
+        expected = lse.Matricial('lstsq').solve(
+            self.coef_matrix, self.rs_matrix)
+        for solver in [lse.Matricial(), lse.Matricial('qr')]:
+            assertSequenceAlmostEqual(
+                self, expected, solver.solve_system(linsys))
+
+    def test_refine_updates_inverse(self):
+        rng = np.random.default_rng(0)
+        coefs = rng.normal(size=(12, 4))
+        coefs[::3, 1] = 0.0
+        results = rng.normal(size=12)
+        for solver in [lse.Matricial(), lse.Matricial('cholesky', 0.5)]:
+            linsys = lse.LinearSystem(4)
+            for until in range(1, 13):
+                linsys.add(coefs[until - 1], results[until - 1])
+                res = solver.refine(
+                    linsys, csr_matrix(coefs[until - 1]), results[until - 1])
+                if until < 4 and not solver.ridge:
+                    continue
+                np.testing.assert_allclose(
+                    res, lse.Matricial('cholesky', solver.ridge).solve(
+                        coefs[:until], results[:until]))
+            np.testing.assert_allclose(
+                solver._inverse @ (linsys.gram + solver.ridge*np.eye(4)),
+                np.eye(4), atol=1e-12)
+            linsys.clear()
+            linsys.add(coefs[:6], results[:6])
+            np.testing.assert_allclose(
+                solver.refine(linsys, coefs[:6], results[:6]),
+                lse.Matricial('cholesky', solver.ridge).solve(
+                    coefs[:6], results[:6]))
+
+    def test_sparse_equations(self):
+        linsys = lse.LinearSystem(2)
+        linsys.add(csr_matrix(self.coef_matrix), self.rs_matrix)
+        np.testing.assert_array_equal(linsys.coeficients(), self.coef_matrix)
+        np.testing.assert_allclose(
+            linsys.gram, self.coef_matrix.T @ self.coef_matrix)
+        np.testing.assert_allclose(
+            linsys.moments, self.coef_matrix.T @ self.rs_matrix)
+
+    def test_clear(self):
+        linsys = lse.LinearSystem(2)
+        linsys.add(self.coef_matrix, self.rs_matrix)
+        linsys.clear()
+        self.assertEqual(linsys.size, 0)
+        self.assertFalse(linsys.gram.any())
+
+
 def assertSequenceAlmostEqual(testcase, seq1, seq2, tolerance=7):
     for s1, s2 in zip(seq1, seq2):
         testcase.assertAlmostEqual(s1, s2, tolerance)
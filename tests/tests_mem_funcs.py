@@ -1,6 +1,7 @@
 from .context import anfys
 import anfys.fuzzy.mem_funcs as memfuncs
 import unittest
+import numpy as np
 
 
 class TestBellTwo(unittest.TestCase):
@@ -124,6 +125,13 @@ class TestBellThree(unittest.TestCase):
         )
         self.assertAlmostEqual(res, 0.275480922521, 12)
 
+    def test_derivative_on_b_at_center(self):
+        res = self.bellThree.partial(self.c, 'b', self.a, self.b, self.c)
+        self.assertEqual(res, 0.0)
+        res = self.bellThree.partial(
+            np.array([self.c, self.value]), 'b', self.a, self.b, self.c)
+        np.testing.assert_allclose(res, [0.0, 0.1116979020317])
+
     def test_derivative_none(self):
         self.setUp()
         try:
@@ -202,3 +210,85 @@ class TestPiecewiseLogit(unittest.TestCase):
         param = self.plogit.parameters[1]
         partial = self.plogit.partial(1 - 1e-10, param, None, None)
         self.assertEqual(partial, 1.0 - 1e-10)
+
+
+class TestBatchEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.array([[0.5, -1.0], [4.0, 0.2], [0.0, 2.0]])
+        self.params = np.array([
+            [[3.0, 2.0, 2.0], [1.0, 1.5, -1.0]],
+            [[0.5, 2.5, 0.1], [2.0, 1.0, 1.0]]
+        ])
+
+    def expect_same_as_scalar(self, mem_func, params):
+        degrees = mem_func.membership_degrees(self.values, params)
+        derivs = mem_func.partials(self.values, params)
+        qtd_params = len(mem_func.parameters)
+        self.assertEqual(degrees.shape, (3, 2, 2))
+        self.assertEqual(derivs.shape, (3, 2, 2, qtd_params))
+        for n, entry in enumerate(self.values):
+            for feat, value in enumerate(entry):
+                for mf, line in enumerate(params[feat]):
+                    self.assertAlmostEqual(
+                        degrees[n, feat, mf],
+                        mem_func.membership_degree(value, *line))
+                    for p, var in enumerate(mem_func.parameters):
+                        self.assertAlmostEqual(
+                            derivs[n, feat, mf, p],
+                            mem_func.partial(value, var, *line))
+
+    def test_belltwo_batch(self):
+        self.expect_same_as_scalar(memfuncs.BellTwo(), self.params[..., :2])
+
+    def test_bellthree_batch(self):
+        self.expect_same_as_scalar(memfuncs.BellThree(), self.params)
+
+    def test_plogit_batch(self):
+        self.expect_same_as_scalar(
+            memfuncs.PiecewiseLogit(), self.params[..., :2])
+
+    def test_single_value_batch(self):
+        degrees = memfuncs.BellTwo().membership_degrees(4, [[3, 2], [1, 4]])
+        self.assertEqual(degrees.shape, (2,))
+        self.assertAlmostEqual(degrees[0], 0.64118038842995, 13)
+        self.assertAlmostEqual(degrees[1], 1.0)
+
+
+class TestLogDegrees(unittest.TestCase):
+
+    def test_log_matches_degree(self):
+        values = np.array([[0.5, -1.0], [4.0, 0.2]])
+        params = np.array([[[3.0, 2.0, 2.0]], [[0.5, 2.5, 0.1]]])
+        for mem_func, width in [(memfuncs.BellTwo(), 2),
+                                (memfuncs.BellThree(), 3),
+                                (memfuncs.PiecewiseLogit(), 2)]:
+            degrees = mem_func.membership_degrees(values, params[..., :width])
+            logs = mem_func.log_membership_degrees(values, params[..., :width])
+            np.testing.assert_allclose(logs, np.log(degrees))
+
+    def test_log_belltwo_no_underflow(self):
+        res = memfuncs.BellTwo().log_membership_degree(40.0, 1.0, 0.0)
+        self.assertAlmostEqual(res, -1600.0)
+
+    def test_log_partials_match_partials(self):
+        values = np.array([[0.5, -1.0], [4.0, 0.2]])
+        params = np.array([[[3.0, 2.0, 2.0]], [[0.5, 2.5, 0.1]]])
+        for mem_func, width in [(memfuncs.BellTwo(), 2),
+                                (memfuncs.BellThree(), 3),
+                                (memfuncs.PiecewiseLogit(), 2)]:
+            degrees = mem_func.membership_degrees(values, params[..., :width])
+            partials = mem_func.partials(values, params[..., :width])
+            log_partials = mem_func.log_partials(
+                values, params[..., :width])
+            np.testing.assert_allclose(
+                log_partials, partials / degrees[..., np.newaxis])
+
+    def test_log_partials_no_underflow(self):
+        self.assertAlmostEqual(
+            memfuncs.BellTwo().log_partial(40.0, 'b', 1.0, 0.0), 80.0)
+        bellthree = memfuncs.BellThree()
+        self.assertAlmostEqual(
+            bellthree.log_partial(1e200, 'a', 1.0, 2.0, 0.0), 4.0)
+        self.assertAlmostEqual(
+            bellthree.log_partial(1e200, 'c', 1.0, 2.0, 0.0), 4e-200)
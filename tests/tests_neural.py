@@ -1,6 +1,20 @@
 from .context import anfys
 import anfys.neural.anfis as anfis
+import anfys.neural.builder as builder
+import anfys.neural.clustering as clustering
+from anfys.neural.monitor import TrainingMonitor
+import anfys.neural.learn as learn
+import anfys.neural.stream as stream
+import anfys.lse as lse
+import anfys.fuzzy.mem_funcs as memfuncs
+from anfys.neural.learn import Layer
+from itertools import product
+from anfys.neural.serving import MicroBatchPredictor
+import asyncio
+import os
+import tempfile
 import unittest
+import numpy as np
 
 
 class TestSugeno(unittest.TestCase):
@@ -10,3 +24,933 @@ class TestSugeno(unittest.TestCase):
 
     def test_setup_arch(self):
         self.when_model_qtd_of_mf_is(3)
+
+
+class TestForwardPass(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(0, 3, 5, 2)
+
+    def test_layers_shape(self):
+        layers = learn.forward_pass(self.model, self.inputs)
+        self.assertEqual(layers[Layer.FUZZYFIER].shape, (5, 2, 3))
+        self.assertEqual(layers[Layer.FIRE].shape, (5, 9))
+        self.assertEqual(layers[Layer.NORMALIZER].shape, (5, 9))
+        self.assertEqual(layers[Layer.DEFUZZIFIER].shape, (5, 9))
+        self.assertEqual(layers[Layer.OUTPUT].shape, (5, ))
+
+    def test_normalized_strengths(self):
+        layers = learn.forward_pass(self.model, self.inputs)
+        sums = layers[Layer.NORMALIZER].sum(axis=1)
+        np.testing.assert_allclose(sums, np.ones(5))
+
+    def test_predict_single_entry(self):
+        expected = [self.one_by_one(entry) for entry in self.inputs]
+        np.testing.assert_allclose(self.model.predict(self.inputs), expected)
+        np.testing.assert_allclose(
+            self.model.predict(self.inputs[0]), expected[:1])
+
+    def one_by_one(self, entry):
+        params = self.model.prem_params.reshape(2, 3, 2)
+        strengths = []
+        for mfs in product(range(3), repeat=2):
+            degrees = [self.model.prem_mf.membership_degree(x, *params[i, mf])
+                       for i, (x, mf) in enumerate(zip(entry, mfs))]
+            strengths.append(np.prod(degrees))
+        strengths = np.array(strengths) / np.sum(strengths)
+        consequents = self.model.cons_params @ np.append(entry, 1.0)
+        return np.sum(strengths * consequents)
+
+
+class TestTnorms(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(6, 2, 5, 3)
+
+    def test_fire_strength_with_fmin(self):
+        self.model.tnorm = 'fmin'
+        layers = learn.forward_pass(self.model, self.inputs)
+        degrees = layers[Layer.FUZZYFIER]
+        expected = [[min(degrees[n, i, mf] for i, mf in enumerate(rule))
+                     for rule in self.model.rules] for n in range(5)]
+        np.testing.assert_allclose(layers[Layer.FIRE], expected)
+
+    def test_gradient_requires_prod(self):
+        self.model.tnorm = 'hamacher'
+        with self.assertRaises(ValueError):
+            learn.premise_gradient(self.model, self.inputs, np.zeros(5))
+
+
+class TestLogDomain(unittest.TestCase):
+
+    def test_same_as_linear_domain(self):
+        rng = np.random.default_rng(2)
+        inputs = rng.uniform(-1, 1, (4, 3))
+        model = anfis.Sugeno(2)
+        builder.configure_model(model, 3)
+        model.cons_params = rng.normal(size=model.cons_params.shape)
+        expected = model.predict(inputs)
+        model.log_domain = True
+        np.testing.assert_allclose(model.predict(inputs), expected)
+
+    def test_many_inputs_without_underflow(self):
+        model = anfis.Sugeno(2, log_domain=True)
+        builder.configure_model(model, 12)
+        model.cons_params[:, -1] = 1.0
+        layers = learn.forward_pass(model, np.full((3, 12), 30.0))
+        sums = layers[Layer.NORMALIZER].sum(axis=1)
+        np.testing.assert_allclose(sums, np.ones(3))
+        np.testing.assert_allclose(layers[Layer.OUTPUT], np.ones(3))
+
+
+class TestSparseRules(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(3, 3, 6, 3)
+
+    def test_all_rules_active(self):
+        dense = learn.forward_pass(self.model, self.inputs)
+        self.model.rule_threshold = 0.0
+        sparse = learn.forward_pass(self.model, self.inputs)
+        np.testing.assert_allclose(
+            sparse[Layer.NORMALIZER].toarray(), dense[Layer.NORMALIZER])
+        np.testing.assert_allclose(
+            sparse[Layer.DEFUZZIFIER].toarray(), dense[Layer.DEFUZZIFIER])
+        np.testing.assert_allclose(sparse[Layer.OUTPUT], dense[Layer.OUTPUT])
+        np.testing.assert_allclose(
+            learn.design_matrix(
+                self.model, sparse[Layer.NORMALIZER], self.inputs).toarray(),
+            learn.design_matrix(
+                self.model, dense[Layer.NORMALIZER], self.inputs))
+
+    def test_top_k_rules(self):
+        self.model.rule_top_k = 2
+        layers = learn.forward_pass(self.model, self.inputs)
+        weights = layers[Layer.NORMALIZER]
+        self.assertEqual(weights.shape, (6, 27))
+        np.testing.assert_array_equal(np.diff(weights.indptr), 8)
+        np.testing.assert_allclose(weights.sum(axis=1), np.ones((6, 1)))
+
+    def test_threshold_keeps_best_rule(self):
+        self.model.rule_threshold = 1.1
+        layers = learn.forward_pass(self.model, self.inputs)
+        weights = layers[Layer.NORMALIZER]
+        np.testing.assert_array_equal(np.diff(weights.indptr), 1)
+        np.testing.assert_allclose(weights.data, 1.0)
+        self.model.rule_threshold = None
+        dense = learn.forward_pass(self.model, self.inputs)
+        np.testing.assert_array_equal(
+            weights.indices, dense[Layer.FIRE].argmax(axis=1))
+
+    def test_threshold_only_kept_combinations(self):
+        self.model.rule_threshold = 0.5
+        layers = learn.forward_pass(self.model, self.inputs)
+        weights, degrees = layers[Layer.FIRE], layers[Layer.FUZZYFIER]
+        kept = np.maximum((degrees >= 0.5).sum(axis=2), 1)
+        np.testing.assert_array_equal(
+            np.diff(weights.indptr), kept.prod(axis=1))
+        self.model.rule_threshold = None
+        dense = learn.forward_pass(self.model, self.inputs)[Layer.FIRE]
+        rows = np.repeat(np.arange(6), np.diff(weights.indptr))
+        np.testing.assert_allclose(
+            weights.data, dense[rows, weights.indices])
+
+    def test_learns_with_sparse_design(self):
+        dense = anfis.Sugeno(3)
+        builder.configure_model(dense, 3)
+        outputs = self.inputs.sum(axis=1)
+        learn.hybrid_offline(dense, self.inputs, outputs)
+        self.model.rule_threshold = 0.0
+        learn.hybrid_offline(self.model, self.inputs, outputs)
+        np.testing.assert_allclose(self.model.cons_params, dense.cons_params)
+        np.testing.assert_allclose(self.model.prem_params, dense.prem_params)
+
+
+class TestPremiseGradient(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, rng = random_model(4, 3, 7, 2)
+        self.outputs = np.sin(self.inputs[:, 0]) + self.inputs[:, 1]
+        self.model.prem_params[:, 0] = rng.uniform(0.5, 1.5, 6)
+
+    def test_gradient_check(self):
+        expected = numerical_gradient(self.model, self.inputs, self.outputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        np.testing.assert_allclose(gradient, expected, rtol=1e-5, atol=1e-8)
+
+    def test_gradient_check_bellthree(self):
+        self.model.prem_mf = memfuncs.BellThree()
+        self.model.prem_params = np.column_stack(
+            (self.model.prem_params, np.full(6, 2.0)))[:, [0, 2, 1]]
+        expected = numerical_gradient(self.model, self.inputs, self.outputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        np.testing.assert_allclose(gradient, expected, rtol=1e-5, atol=1e-8)
+
+    def test_gradient_check_at_bellthree_center(self):
+        self.model.prem_mf = memfuncs.BellThree()
+        self.model.prem_params = np.column_stack(
+            (self.model.prem_params, np.full(6, 2.0)))[:, [0, 2, 1]]
+        self.inputs[0] = self.model.prem_params[[1, 4], 2]
+        expected = numerical_gradient(self.model, self.inputs, self.outputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        np.testing.assert_allclose(gradient, expected, rtol=1e-5, atol=1e-8)
+
+    def test_non_finite_gradient(self):
+        gradient = np.full(self.model.prem_params.shape, np.nan)
+        with self.assertRaises(ValueError):
+            learn._update_premise_parameters(self.model, gradient)
+
+    def test_gradient_check_sparse(self):
+        self.model.rule_top_k = 2
+        expected = numerical_gradient(self.model, self.inputs, self.outputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        np.testing.assert_allclose(gradient, expected, rtol=1e-5, atol=1e-8)
+
+    def test_gradient_check_underflowed_degrees(self):
+        # Every degree underflows, exp(-(600/20)**2) being zero
+        inputs = self.inputs + 600.0
+        self.model.prem_params[:, 0] = 20.0
+        for log_domain, top_k in [(True, None), (False, 2)]:
+            self.model.log_domain = log_domain
+            self.model.rule_top_k = top_k
+            layers = learn.forward_pass(self.model, inputs)
+            self.assertFalse(np.any(layers[Layer.FUZZYFIER]))
+            expected = numerical_gradient(self.model, inputs, self.outputs)
+            gradient = learn.premise_gradient(
+                self.model, inputs, self.outputs)
+            self.assertGreater(np.linalg.norm(expected), 1e-3)
+            np.testing.assert_allclose(
+                gradient, expected, rtol=1e-4, atol=1e-6)
+
+
+def random_model(seed, subset_size, qtd_entries, qtd_inputs,
+                 rule_base='grid'):
+    """ A configured Sugeno with random consequents and random entries in
+    [-1, 1], along with the generator that drew them """
+    rng = np.random.default_rng(seed)
+    inputs = rng.uniform(-1, 1, (qtd_entries, qtd_inputs))
+    model = anfis.Sugeno(subset_size)
+    model.rule_base = rule_base
+    builder.configure_model(model, qtd_inputs)
+    model.cons_params = rng.normal(size=model.cons_params.shape)
+    return model, inputs, rng
+
+
+def squared_error(model, inputs, outputs):
+    return 0.5 * np.sum((model.predict(inputs) - outputs)**2)
+
+
+def numerical_gradient(model, inputs, outputs, delta=1e-6):
+    """ Central differences of the squared error w.r.t. each premise
+    parameter """
+    gradient = np.zeros_like(model.prem_params)
+    for index in np.ndindex(*model.prem_params.shape):
+        original = model.prem_params[index]
+        model.prem_params[index] = original + delta
+        forward = squared_error(model, inputs, outputs)
+        model.prem_params[index] = original - delta
+        backward = squared_error(model, inputs, outputs)
+        model.prem_params[index] = original
+        gradient[index] = (forward - backward) / (2*delta)
+    return gradient
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(7, 2, 10, 2)
+        self.outputs = self.inputs.sum(axis=1)
+
+    def test_records_every_stage(self):
+        profiler = self.model.enable_profiling()
+        learn.hybrid_offline(self.model, self.inputs, self.outputs, 5)
+        self.assertEqual(
+            set(profiler.stats),
+            {'FUZZYFIER', 'FIRE', 'NORMALIZER', 'DEFUZZIFIER', 'OUTPUT',
+             'LSE', 'GRADIENT'})
+        self.assertEqual(profiler.stats['FIRE'].calls, 2)
+        self.assertEqual(profiler.stats['FIRE'].last_size, 5 * 4)
+        self.assertIn('LSE', profiler.summary())
+
+    def test_callback(self):
+        records = []
+        self.model.enable_profiling(
+            lambda stage, elapsed, size: records.append(stage))
+        self.model.predict(self.inputs)
+        self.assertEqual(records, ['FUZZYFIER', 'FIRE', 'NORMALIZER',
+                                   'DEFUZZIFIER', 'OUTPUT'])
+
+    def test_records_from_threads(self):
+        profiler = self.model.enable_profiling()
+        self.model.predict(np.tile(self.inputs, (40, 1)), n_jobs=4,
+                           chunk_size=10)
+        for stage in ['FUZZYFIER', 'FIRE', 'OUTPUT']:
+            self.assertEqual(profiler.stats[stage].calls, 40)
+        self.assertEqual(profiler.stats['OUTPUT'].total_size, 400)
+
+    def test_disabled(self):
+        self.model.enable_profiling()
+        self.model.disable_profiling()
+        self.model.predict(self.inputs)
+        self.assertIsNone(self.model.profiler)
+
+
+class TestMembershipCache(unittest.TestCase):
+
+    def setUp(self):
+        self.model, inputs, _ = random_model(14, 3, 40, 2)
+        # Quantized to quarters, so values repeat
+        self.inputs = np.round(inputs * 4) / 4
+        self.outputs = self.inputs.sum(axis=1)
+
+    def test_same_predictions(self):
+        expected = self.model.predict(self.inputs)
+        cache = self.model.enable_membership_cache()
+        np.testing.assert_allclose(self.model.predict(self.inputs), expected)
+        np.testing.assert_allclose(self.model.predict(self.inputs), expected)
+        self.assertEqual(cache.misses, 2 * 9)
+        self.assertAlmostEqual(cache.hit_rate(), 1 - 18 / 160)
+
+    def test_invalidated_by_premise_update(self):
+        cache = self.model.enable_membership_cache()
+        self.model.predict(self.inputs)
+        self.model.prem_params[0, 1] += 0.3
+        predictions = self.model.predict(self.inputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        self.assertEqual(cache.invalidations, 1)
+        self.model.disable_membership_cache()
+        np.testing.assert_allclose(
+            predictions, self.model.predict(self.inputs))
+        np.testing.assert_allclose(gradient, learn.premise_gradient(
+            self.model, self.inputs, self.outputs))
+
+    def test_resolution_and_max_size(self):
+        self.model.log_domain = True
+        rounded = np.round((self.inputs + 0.1) / 0.5) * 0.5
+        expected = learn.forward_pass(self.model, rounded)
+        cache = self.model.enable_membership_cache(resolution=0.5, max_size=2)
+        layers = learn.forward_pass(self.model, self.inputs + 0.1)
+        np.testing.assert_allclose(layers[Layer.FUZZYFIER],
+                                   expected[Layer.FUZZYFIER])
+        self.assertTrue(all(len(table) <= 2
+                            for table in cache._tables.values()))
+
+
+class TestFrozen(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(8, 3, 6, 3)
+
+    def expect_same_predictions(self):
+        frozen = self.model.freeze()
+        np.testing.assert_allclose(
+            frozen.predict(self.inputs), self.model.predict(self.inputs))
+        np.testing.assert_allclose(
+            frozen.predict(self.inputs[0]), self.model.predict(self.inputs[0]))
+
+    def test_predict(self):
+        self.expect_same_predictions()
+
+    def test_predict_log_domain(self):
+        self.model.log_domain = True
+        self.expect_same_predictions()
+
+    def test_predict_other_tnorm(self):
+        self.model.tnorm = 'hamacher'
+        self.expect_same_predictions()
+
+    def test_bellthree_validated_once(self):
+        self.model.prem_mf = memfuncs.BellThree()
+        self.model.prem_params = np.column_stack(
+            (self.model.prem_params, np.full(9, 2.0)))[:, [0, 2, 1]]
+        self.expect_same_predictions()
+        self.model.prem_params[0, 0] = 0.0
+        with self.assertRaises(ValueError):
+            self.model.freeze()
+
+    def test_immutable(self):
+        frozen = self.model.freeze()
+        with self.assertRaises(AttributeError):
+            frozen.cons_params = None
+        with self.assertRaises(ValueError):
+            frozen.cons_params[0, 0] = 1.0
+        self.model.cons_params[0, 0] += 1.0
+        self.assertNotEqual(frozen.cons_params[0, 0],
+                            self.model.cons_params[0, 0])
+
+    def test_sparse_not_supported(self):
+        self.model.rule_top_k = 2
+        with self.assertRaises(ValueError):
+            self.model.freeze()
+
+
+class TestPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(9, 2, 6, 3)
+        self.model.log_domain = True
+        self.model.prem_mf = memfuncs.BellThree()
+        self.model.prem_params = np.column_stack(
+            (self.model.prem_params, np.full(6, 2.0)))[:, [0, 2, 1]]
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'model.anfys')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory_mapped_roundtrip(self):
+        self.model.save(self.path)
+        loaded = anfis.ANFIS.load(self.path)
+        self.assertIsInstance(loaded, anfis.Sugeno)
+        self.assertIsInstance(loaded.prem_mf, memfuncs.BellThree)
+        self.assertIsInstance(loaded.cons_params, np.memmap)
+        self.assertFalse(loaded.cons_params.flags.writeable)
+        np.testing.assert_array_equal(loaded.rules, self.model.rules)
+        np.testing.assert_allclose(
+            loaded.predict(self.inputs), self.model.predict(self.inputs))
+
+    def test_load_in_memory_and_train(self):
+        self.model.save(self.path)
+        loaded = anfis.ANFIS.load(self.path, mmap_mode=None)
+        outputs = self.inputs.sum(axis=1)
+        learn.hybrid_offline(loaded, self.inputs, outputs)
+        self.assertFalse(np.allclose(loaded.prem_params,
+                                     self.model.prem_params))
+
+    def test_not_a_model_file(self):
+        with open(self.path, 'wb') as stream:
+            stream.write(b'not a model at all, just some bytes')
+        with self.assertRaises(ValueError):
+            anfis.ANFIS.load(self.path)
+
+
+class TestHybridLearn(unittest.TestCase):
+
+    def test_fit_linear_target(self):
+        rng = np.random.default_rng(1)
+        inputs = rng.uniform(-1, 1, (30, 2))
+        outputs = 2.0*inputs[:, 0] - inputs[:, 1] + 0.5
+        model = anfis.Sugeno(2)
+        model.fit_by_hybrid_learn(inputs, outputs, 1)
+        np.testing.assert_allclose(model.predict(inputs), outputs, atol=5e-2)
+
+    def test_fit_with_matricial_regressor(self):
+        rng = np.random.default_rng(1)
+        inputs = rng.uniform(-1, 1, (30, 2))
+        outputs = 2.0*inputs[:, 0] - inputs[:, 1] + 0.5
+        model = anfis.Sugeno(2)
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(inputs, outputs, 1)
+        self.assertEqual(model.linsys.size, 30)
+        np.testing.assert_allclose(model.predict(inputs), outputs, atol=1e-6)
+
+    def test_linear_system_holds_one_epoch(self):
+        rng = np.random.default_rng(1)
+        inputs = rng.uniform(-1, 1, (30, 2))
+        outputs = 2.0*inputs[:, 0] - inputs[:, 1] + 0.5
+        model = anfis.Sugeno(2)
+        model.fit_by_hybrid_learn(inputs, outputs, 2)
+        self.assertEqual(model.linsys.size, 0)
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(inputs, outputs, 2)
+        self.assertEqual(model.linsys.size, 30)
+
+    def test_online_same_as_single_entry_batches(self):
+        rng = np.random.default_rng(1)
+        inputs = rng.uniform(-1, 1, (30, 2))
+        outputs = np.sin(2*inputs[:, 0]) + inputs[:, 1]
+        online = anfis.Sugeno(2)
+        online.fit_by_hybrid_learn(inputs, outputs, 3)
+        batches = anfis.Sugeno(2)
+        batches.fit_by_hybrid_learn(inputs, outputs, 3, batch_size=1)
+        np.testing.assert_allclose(online.cons_params, batches.cons_params)
+        np.testing.assert_allclose(online.prem_params, batches.prem_params)
+
+    def test_fit_by_mini_batches(self):
+        rng = np.random.default_rng(1)
+        inputs = rng.uniform(-1, 1, (30, 2))
+        outputs = 2.0*inputs[:, 0] - inputs[:, 1] + 0.5
+        model = anfis.Sugeno(2)
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(inputs, outputs, 2, batch_size=8)
+        self.assertEqual(model.linsys.size, 30)
+        np.testing.assert_allclose(model.predict(inputs), outputs, atol=1e-6)
+
+    def test_full_batch_reduces_error(self):
+        rng = np.random.default_rng(5)
+        inputs = rng.uniform(-1, 1, (60, 2))
+        outputs = np.sin(3*inputs[:, 0]) * inputs[:, 1]
+        model = anfis.Sugeno(3)
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(inputs, outputs, 1, batch_size=60)
+        first = squared_error(model, inputs, outputs)
+        for _ in range(10):
+            learn.hybrid_offline(model, inputs, outputs)
+        self.assertLess(squared_error(model, inputs, outputs), first)
+
+
+class TestBuilder(unittest.TestCase):
+
+    def test_rules_table(self):
+        model = anfis.Sugeno(3)
+        builder.configure_model(model, 4)
+        expected = list(product(range(3), repeat=4))
+        self.assertEqual(model.rules.shape, (81, 4))
+        self.assertEqual([tuple(rule) for rule in model.rules], expected)
+
+
+class TestRaggedPartitions(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, rng = random_model(15, [1, 3, 2], 8, 3)
+        self.outputs = np.sin(self.inputs[:, 1]) + self.inputs[:, 2]
+        self.model.prem_params[:, 0] = rng.uniform(0.5, 1.5, 6)
+
+    def test_rules_and_params(self):
+        expected = list(product(range(1), range(3), range(2)))
+        self.assertEqual([tuple(rule) for rule in self.model.rules], expected)
+        self.assertEqual(self.model.qtd_rules, 6)
+        self.assertEqual(self.model.prem_params.shape, (6, 2))
+        np.testing.assert_array_equal(self.model.mf_offsets, [0, 1, 4, 6])
+
+    def test_predict(self):
+        layers = learn.forward_pass(self.model, self.inputs)
+        self.assertEqual(layers[Layer.FUZZYFIER].shape, (8, 3, 3))
+        np.testing.assert_array_equal(layers[Layer.FUZZYFIER][:, 0, 1:], 0)
+        expected = [self.one_by_one(entry) for entry in self.inputs]
+        np.testing.assert_allclose(layers[Layer.OUTPUT], expected)
+        self.model.log_domain = True
+        np.testing.assert_allclose(self.model.predict(self.inputs), expected)
+        np.testing.assert_allclose(
+            self.model.freeze().predict(self.inputs), expected)
+
+    def test_sparse_rules(self):
+        dense = self.model.predict(self.inputs)
+        self.model.rule_threshold = 0.0
+        np.testing.assert_allclose(self.model.predict(self.inputs), dense)
+        self.model.rule_top_k = 2
+        weights = learn.forward_pass(self.model, self.inputs)[Layer.FIRE]
+        np.testing.assert_array_equal(np.diff(weights.indptr), 4)
+
+    def test_gradient_check(self):
+        expected = numerical_gradient(self.model, self.inputs, self.outputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        np.testing.assert_allclose(gradient, expected, rtol=1e-5, atol=1e-8)
+
+    def test_saved(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'ragged.anfys')
+            self.model.save(path)
+            loaded = anfis.ANFIS.load(path, mmap_mode=None)
+            np.testing.assert_allclose(loaded.predict(self.inputs),
+                                       self.model.predict(self.inputs))
+
+    def test_one_size_per_input(self):
+        with self.assertRaises(ValueError):
+            builder.configure_model(anfis.Sugeno([2, 3]), 3)
+
+    def one_by_one(self, entry):
+        params = self.model.prem_params
+        offsets = self.model.mf_offsets
+        strengths = []
+        for mfs in self.model.rules:
+            degrees = [self.model.prem_mf.membership_degree(
+                x, *params[offsets[i] + mf]) for i, (x, mf)
+                in enumerate(zip(entry, mfs))]
+            strengths.append(np.prod(degrees))
+        strengths = np.array(strengths) / np.sum(strengths)
+        consequents = self.model.cons_params @ np.append(entry, 1.0)
+        return np.sum(strengths * consequents)
+
+
+class TestClustering(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(16)
+        self.centers = np.array([[10.0, 0.0], [14.0, 3.0], [18.0, -3.0]])
+        self.inputs = np.vstack([rng.normal(center, 0.3, (30, 2))
+                                 for center in self.centers])
+        self.outputs = 0.5*self.inputs[:, 0] - self.inputs[:, 1]
+
+    def test_kmeans(self):
+        centers, labels = clustering.kmeans(self.inputs, 3, seed=1)
+        order = np.argsort(centers[:, 0])
+        np.testing.assert_allclose(centers[order], self.centers, atol=0.2)
+        np.testing.assert_array_equal(
+            np.bincount(labels, minlength=3), [30, 30, 30])
+
+    def test_subtractive_finds_clusters(self):
+        centers = clustering.subtractive(self.inputs, radius=0.3)
+        self.assertEqual(len(centers), 3)
+        centers = centers[np.argsort(centers[:, 0])]
+        np.testing.assert_allclose(centers, self.centers, atol=0.6)
+        with self.assertRaises(ValueError):
+            clustering.subtractive(np.ones(4), qtd_clusters=2)
+
+    def test_premises_from_data(self):
+        for prem_init in ['kmeans', 'subtractive']:
+            model = anfis.Sugeno(3)
+            model.regressor = lse.Matricial()
+            model.prem_init = prem_init
+            model.fit_by_hybrid_learn(self.inputs, self.outputs, 1, 90)
+            means = model.prem_params[:3, 1]
+            np.testing.assert_allclose(means, self.centers[:, 0], atol=0.6)
+            np.testing.assert_allclose(
+                model.predict(self.inputs), self.outputs, atol=1e-6)
+
+    def test_fewer_values_than_mfs(self):
+        inputs = np.column_stack(
+            (self.inputs[:, 0], self.inputs[:, 1] > 0)).astype(float)
+        for prem_init in ['kmeans', 'subtractive']:
+            model = anfis.Sugeno(3)
+            model.regressor = lse.Matricial()
+            model.prem_init = prem_init
+            builder.configure_model(model, 2, inputs=inputs)
+            np.testing.assert_allclose(
+                model.prem_params[3:, 1], [0.0, 0.5, 1.0])
+            np.testing.assert_allclose(
+                model.prem_params[3:, 0], np.sqrt(2.0) / 6)
+            model.fit_by_hybrid_learn(inputs, self.outputs, 1, 90)
+            self.assertTrue(np.all(np.isfinite(model.predict(inputs))))
+        model = anfis.Sugeno(3)
+        model.prem_init = 'subtractive'
+        close = np.array([[0.0]]*20 + [[1e-9]] + [[1.0]]*5)
+        builder.configure_model(model, 1, inputs=close)
+        np.testing.assert_allclose(
+            model.prem_params[:, 1], [0.0, 1e-9, 1.0], atol=1e-12)
+        model = anfis.Sugeno(3)
+        model.rule_base = 'clusters'
+        model.prem_init = 'subtractive'
+        builder.configure_model(model, 2, inputs=np.ones((10, 2)))
+        np.testing.assert_allclose(
+            model.prem_params[:, 1], [0.0, 1.0, 2.0, 0.0, 1.0, 2.0])
+
+    def test_unknown_initialisation(self):
+        model = anfis.Sugeno(2)
+        model.prem_init = 'random'
+        with self.assertRaises(ValueError):
+            builder.configure_model(model, 2, inputs=self.inputs)
+
+
+class TestRuleBases(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(
+            17, 3, 12, 2, rule_base=[[0, 0], [1, 2], [2, 1]])
+        self.outputs = np.sin(self.inputs[:, 0]) + self.inputs[:, 1]
+
+    def test_scatter_rules(self):
+        self.assertEqual(self.model.qtd_rules, 3)
+        self.assertEqual(self.model.cons_params.shape, (3, 3))
+        params = self.model.prem_params.reshape(2, 3, 2)
+        mf = self.model.prem_mf
+        strengths = np.array([
+            mf.membership_degree(self.inputs[:, 0], *params[0, first])
+            * mf.membership_degree(self.inputs[:, 1], *params[1, second])
+            for first, second in self.model.rule_base]).T
+        consequents = (np.column_stack((self.inputs, np.ones(12)))
+                       @ self.model.cons_params.T)
+        expected = (np.sum(strengths * consequents, axis=1)
+                    / strengths.sum(axis=1))
+        np.testing.assert_allclose(self.model.predict(self.inputs), expected)
+
+    def test_gradient_check(self):
+        expected = numerical_gradient(self.model, self.inputs, self.outputs)
+        gradient = learn.premise_gradient(
+            self.model, self.inputs, self.outputs)
+        np.testing.assert_allclose(gradient, expected, rtol=1e-5, atol=1e-8)
+
+    def test_invalid_rules(self):
+        for rules in ([[0, 3]], [[0, 1, 2]], 'scatter'):
+            self.model.rule_base = rules
+            with self.assertRaises(ValueError):
+                builder.configure_model(self.model, 2)
+
+    def test_sparse_activation_requires_grid(self):
+        self.model.rule_top_k = 1
+        with self.assertRaises(ValueError):
+            self.model.predict(self.inputs)
+
+    def test_saved(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'scatter.anfys')
+            self.model.save(path)
+            loaded = anfis.ANFIS.load(path, mmap_mode=None)
+        np.testing.assert_array_equal(loaded.rule_base, self.model.rules)
+        np.testing.assert_allclose(loaded.predict(self.inputs),
+                                   self.model.predict(self.inputs))
+
+    def test_clustered_rules(self):
+        rng = np.random.default_rng(18)
+        centers = rng.uniform(-5, 5, (3, 6))
+        inputs = np.vstack([rng.normal(center, 0.2, (40, 6))
+                            for center in centers])
+        outputs = inputs @ np.arange(6.0) + 1.0
+        model = anfis.Sugeno(3)
+        model.rule_base = 'clusters'
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(inputs, outputs, 1, 120)
+        self.assertEqual(model.qtd_rules, 3)
+        np.testing.assert_array_equal(model.rules[:, 0], [0, 1, 2])
+        means = model.prem_params[:, 1].reshape(6, 3).T
+        self.assertTrue(all(np.abs(means - center).max(axis=1).min() < 0.2
+                            for center in centers))
+        np.testing.assert_allclose(model.predict(inputs), outputs, atol=1e-6)
+
+
+class TestTrainingMonitor(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(19)
+        inputs = rng.uniform(-1, 1, (80, 2))
+        outputs = np.sin(3*inputs[:, 0]) * inputs[:, 1]
+        self.inputs, self.outputs = inputs[:60], outputs[:60]
+        self.validation = (inputs[60:], outputs[60:])
+        self.model = anfis.Sugeno(3)
+        self.model.regressor = lse.Matricial()
+
+    def test_stops_on_plateau(self):
+        monitor = TrainingMonitor(patience=2, tol=10.0)
+        self.model.fit_by_hybrid_learn(
+            self.inputs, self.outputs, 20, batch_size=60, monitor=monitor)
+        self.assertEqual(monitor.stopped_epoch, 3)
+        self.assertEqual([epoch for epoch, _ in monitor.history], [1, 2, 3])
+
+    def test_keeps_best_parameters(self):
+        monitor = TrainingMonitor(self.validation, patience=3, every=2)
+        self.model.fit_by_hybrid_learn(
+            self.inputs, self.outputs, 10, batch_size=20, monitor=monitor)
+        self.assertEqual([epoch for epoch, _ in monitor.history][:2], [2, 4])
+        predictions = self.model.predict(self.validation[0])
+        error = np.sqrt(np.mean((predictions - self.validation[1])**2))
+        self.assertAlmostEqual(error, monitor.best_error)
+        self.assertEqual(
+            error, min(measured for _, measured in monitor.history))
+
+    def test_jang_step_size_rules(self):
+        monitor = TrainingMonitor()
+        self.model.step_size = 0.1
+        monitor._trend = [-1, -1, -1, -1]
+        monitor._adapt_step(self.model)
+        self.assertAlmostEqual(self.model.step_size, 0.11)
+        monitor._trend = [1, -1, 1, -1]
+        monitor._adapt_step(self.model)
+        self.assertAlmostEqual(self.model.step_size, 0.099)
+        monitor._trend = [1, -1, -1, -1]
+        monitor._adapt_step(self.model)
+        self.assertAlmostEqual(self.model.step_size, 0.099)
+
+    def test_stream_needs_validation(self):
+        chunks = stream.ArrayChunks(self.inputs, self.outputs, 20)
+        with self.assertRaises(ValueError):
+            self.model.fit_stream(chunks, 2, monitor=TrainingMonitor())
+        monitor = TrainingMonitor(self.validation, patience=1, tol=10.0)
+        self.model.fit_stream(chunks, 5, monitor=monitor)
+        self.assertEqual(monitor.stopped_epoch, 2)
+
+
+class TestPartialFit(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(20)
+        self.inputs = rng.uniform(-1, 1, (100, 2))
+        self.outputs = np.sin(2*self.inputs[:, 0]) + self.inputs[:, 1]
+
+    def test_same_as_online_epoch(self):
+        model = anfis.Sugeno(2)
+        model.fit_by_hybrid_learn(self.inputs[:60], self.outputs[:60], 1)
+        daily = anfis.Sugeno(2)
+        daily.partial_fit(self.inputs[:25], self.outputs[:25])
+        daily.partial_fit(self.inputs[25:60], self.outputs[25:60])
+        self.assertFalse(daily.linsys.keep_equations)
+        np.testing.assert_allclose(daily.predict(self.inputs),
+                                   model.predict(self.inputs))
+
+    def test_keeps_normal_equations(self):
+        model = anfis.Sugeno(2)
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(
+            self.inputs[:60], self.outputs[:60], 2, batch_size=60)
+        premises = model.prem_params.copy()
+        model.partial_fit(self.inputs[60:], self.outputs[60:], 40)
+        self.assertEqual(model.linsys.size, 100)
+        self.assertLessEqual(
+            np.linalg.norm(model.prem_params - premises),
+            model.step_size + 1e-12)
+
+    def test_loaded_model_starts_from_consequents(self):
+        model = anfis.Sugeno(2)
+        model.fit_by_hybrid_learn(self.inputs[:60], self.outputs[:60], 1)
+        expected = model.predict(self.inputs)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'daily.anfys')
+            model.save(path)
+            loaded = anfis.ANFIS.load(path, mmap_mode=None)
+        loaded.step_size = 0.0
+        loaded.partial_fit(self.inputs[60:], expected[60:])
+        np.testing.assert_allclose(loaded.predict(self.inputs), expected)
+
+    def test_loaded_model_keeps_training_state(self):
+        for regressor in [lse.Recursive(1.0, 1000), lse.Matricial()]:
+            model = anfis.Sugeno(2)
+            model.regressor = regressor
+            model.fit_by_hybrid_learn(self.inputs[:60], self.outputs[:60], 1)
+            with tempfile.TemporaryDirectory() as folder:
+                path = os.path.join(folder, 'daily.anfys')
+                model.save(path)
+                loaded = anfis.ANFIS.load(path, mmap_mode='c')
+                with self.assertRaises(ValueError):
+                    anfis.ANFIS.load(path).partial_fit(
+                        self.inputs[60:65], self.outputs[60:65])
+            self.assertIsInstance(loaded.regressor, type(regressor))
+            model.partial_fit(self.inputs[60:65], self.outputs[60:65])
+            loaded.partial_fit(self.inputs[60:65], self.outputs[60:65])
+            np.testing.assert_allclose(loaded.cons_params, model.cons_params)
+            np.testing.assert_allclose(
+                loaded.predict(self.inputs), model.predict(self.inputs))
+
+    def test_starts_from_restored_consequents(self):
+        model = anfis.Sugeno(2)
+        # Fitting can not get close to offset targets, so the error stalls
+        # and an earlier epoch is restored
+        validation = (self.inputs[60:], self.outputs[60:] + 5.0)
+        monitor = TrainingMonitor(validation, patience=2)
+        model.fit_by_hybrid_learn(
+            self.inputs[:60], self.outputs[:60], 5, monitor=monitor)
+        self.assertLess(monitor.best_epoch, monitor.stopped_epoch)
+        expected = model.predict(self.inputs)
+        model.step_size = 0.0
+        model.partial_fit(self.inputs[60:61], expected[60:61])
+        np.testing.assert_allclose(model.predict(self.inputs), expected)
+
+
+class TestStreamTraining(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(10)
+        self.inputs = rng.uniform(-1, 1, (40, 2))
+        self.outputs = np.sin(3*self.inputs[:, 0]) * self.inputs[:, 1]
+
+    def trained_by_batches(self):
+        model = anfis.Sugeno(2)
+        model.regressor = lse.Matricial()
+        model.fit_by_hybrid_learn(self.inputs, self.outputs, 3, batch_size=20)
+        return model
+
+    def test_same_as_mini_batches(self):
+        expected = self.trained_by_batches()
+        model = anfis.Sugeno(2)
+        model.regressor = lse.Matricial()
+        model.fit_stream(
+            stream.ArrayChunks(self.inputs, self.outputs, 40), 3, 20)
+        self.assertFalse(model.linsys.keep_equations)
+        np.testing.assert_allclose(
+            model.predict(self.inputs), expected.predict(self.inputs),
+            atol=1e-6)
+
+    def test_from_npy_files(self):
+        expected = self.trained_by_batches()
+        with tempfile.TemporaryDirectory() as directory:
+            inputs_path = os.path.join(directory, 'inputs.npy')
+            outputs_path = os.path.join(directory, 'outputs.npy')
+            np.save(inputs_path, self.inputs)
+            np.save(outputs_path, self.outputs)
+            model = anfis.Sugeno(2)
+            model.regressor = lse.Matricial()
+            model.fit_stream(
+                stream.NpyChunks(inputs_path, outputs_path, 20), 3)
+        np.testing.assert_allclose(
+            model.predict(self.inputs), expected.predict(self.inputs),
+            atol=1e-6)
+
+    def test_one_shot_iterator(self):
+        chunks = iter(stream.ArrayChunks(self.inputs, self.outputs, 10))
+        with self.assertRaises(ValueError):
+            anfis.Sugeno(2).fit_stream(chunks, 2)
+        chunks = iter(stream.ArrayChunks(self.inputs, self.outputs, 10))
+        anfis.Sugeno(2).fit_stream(chunks, 1)
+
+
+class TestParallelTraining(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.inputs = rng.uniform(-1, 1, (50, 2))
+        self.outputs = np.sin(3*self.inputs[:, 0]) * self.inputs[:, 1]
+
+    def test_same_as_full_batch(self):
+        expected = anfis.Sugeno(2)
+        expected.regressor = lse.Matricial()
+        expected.fit_by_hybrid_learn(self.inputs, self.outputs, 3, 50)
+        model = anfis.Sugeno(2)
+        model.regressor = lse.Matricial()
+        model.fit_parallel(self.inputs, self.outputs, 3, n_jobs=2)
+        self.assertTrue(model.prem_params.flags.owndata)
+        np.testing.assert_allclose(model.prem_params, expected.prem_params)
+        np.testing.assert_allclose(
+            model.predict(self.inputs), expected.predict(self.inputs))
+
+    def test_threaded_predict(self):
+        model = anfis.Sugeno(3)
+        builder.configure_model(model, 2)
+        model.cons_params = np.random.default_rng(12).normal(
+            size=model.cons_params.shape)
+        expected = model.predict(self.inputs)
+        np.testing.assert_allclose(
+            model.predict(self.inputs, n_jobs=3, chunk_size=7), expected)
+        np.testing.assert_allclose(
+            model.predict(self.inputs, n_jobs=None), expected)
+        np.testing.assert_allclose(
+            model.predict(self.inputs[0], n_jobs=2), expected[:1])
+
+    def test_requires_matricial(self):
+        with self.assertRaises(ValueError):
+            anfis.Sugeno(2).fit_parallel(self.inputs, self.outputs, 1)
+
+
+class TestMicroBatchPredictor(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.inputs, _ = random_model(13, 2, 10, 2)
+
+    def test_concurrent_requests(self):
+        predictor = MicroBatchPredictor(self.model, max_batch_size=4)
+
+        async def requests():
+            outputs = await asyncio.gather(
+                *[predictor.predict(entry) for entry in self.inputs])
+            await predictor.close()
+            return outputs
+
+        outputs = asyncio.run(requests())
+        np.testing.assert_allclose(outputs, self.model.predict(self.inputs))
+        self.assertEqual(predictor.qtd_batches, 3)
+        self.assertEqual(predictor.qtd_requests, 10)
+
+    def test_waits_for_batch(self):
+        predictor = MicroBatchPredictor(
+            self.model.freeze(), max_batch_size=64, max_wait=0.01)
+
+        async def request():
+            return await predictor.predict(self.inputs[0])
+
+        output = asyncio.run(request())
+        self.assertAlmostEqual(output, self.model.predict(self.inputs[0])[0])
+        self.assertEqual(predictor.qtd_batches, 1)
+
+    def test_errors_reach_every_request(self):
+        predictor = MicroBatchPredictor(self.model, max_batch_size=2)
+
+        async def requests():
+            return await asyncio.gather(
+                predictor.predict([0.0, 0.0]), predictor.predict([0.0]),
+                return_exceptions=True)
+
+        outputs = asyncio.run(requests())
+        self.assertTrue(all(isinstance(out, ValueError) for out in outputs))
@@ -1,6 +1,9 @@
 from .context import anfys
 import anfys.fuzzy.operations.tconorm as tconorm
+import anfys.fuzzy.operations as operations
+import functools
 import unittest
+import numpy as np
 
 
 class TestTconorm(unittest.TestCase):
@@ -92,3 +95,29 @@ class TestTconorm(unittest.TestCase):
         self.raising_tconorm(tconorm.einstein_sum, None, 3, ValueError)
         self.raising_tconorm(tconorm.einstein_sum, None, None, ValueError)
         self.raising_tconorm(tconorm.einstein_sum, 0, None, ValueError)
+
+
+class TestArrayTconorm(unittest.TestCase):
+
+    def setUp(self):
+        grid = [0, 0.2, 0.5, 0.8, 1, 3]
+        pairs = [(a, b) for a in grid for b in grid]
+        self.a = np.array([a for a, _ in pairs], dtype=float)
+        self.b = np.array([b for _, b in pairs], dtype=float)
+
+    def test_same_as_scalar(self):
+        for name, fun in tconorm.ARRAY_TCONORMS.items():
+            scalar = getattr(tconorm, name)
+            expected = [scalar(a, b) for a, b in zip(self.a, self.b)]
+            np.testing.assert_allclose(
+                fun(self.a, self.b), expected, err_msg=name)
+
+    def test_reduce_same_as_fold(self):
+        values = np.random.default_rng(0).uniform(0, 1, (4, 5, 3))
+        for name, fun in tconorm.ARRAY_TCONORMS.items():
+            scalar = getattr(tconorm, name)
+            expected = [[functools.reduce(scalar, line) for line in lines]
+                        for lines in values]
+            np.testing.assert_allclose(
+                operations.reduce(fun, values, axis=2), expected,
+                err_msg=name)